@@ -1,37 +1,477 @@
 # database/db.py
-import aiosqlite
+"""
+SQLite logging store.
+
+One long-lived writer connection plus a small pool of read-only reader
+connections are opened by init_db() and reused for every call, so logging
+and history reads don't pay connection/thread setup each time. The file is
+switched to WAL journaling, which lets readers run while the writer commits.
+SQL strings are module constants so sqlite3's per-connection statement cache
+keeps them prepared.
+"""
+import os
 import time
+import base64
+import asyncio
+import logging
+import urllib.parse
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+from . import rollups
+from ..services import json_log
+
+DB_PATH = os.environ.get("MAITRI_DB_PATH", "maitri_audio.db")
+READER_POOL_SIZE = int(os.environ.get("MAITRI_DB_READERS", "2"))
+# retention needs incremental auto-vacuum; switching an existing file over costs one full VACUUM,
+# so init_db only does it when asked to (retention enabled) and this isn't "0"
+INCREMENTAL_VACUUM = os.environ.get("MAITRI_DB_INCREMENTAL_VACUUM", "1") == "1"
+# NORMAL is durable across application crashes in WAL mode; only an OS crash can lose the last commits
+SYNCHRONOUS = os.environ.get("MAITRI_DB_SYNCHRONOUS", "NORMAL")
+BUSY_TIMEOUT_MS = 5000
+STATEMENT_CACHE_SIZE = 64
+
+_CREATE_LOGS_SQL = """
+    CREATE TABLE IF NOT EXISTS logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        state TEXT,
+        accuracy REAL,
+        user_message TEXT,
+        inference_time REAL,
+        timestamp INTEGER
+    )
+"""
+# (timestamp, id) is the history sort/keyset key; the state variant serves filtered pages
+_CREATE_INDEXES_SQL = (
+    "CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp, id)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_state_timestamp ON logs (state, timestamp, id)",
+)
+_INSERT_LOG_SQL = "INSERT INTO logs (state, accuracy, user_message, inference_time, timestamp) VALUES (?, ?, ?, ?, ?)"
+
+LOG_COLUMNS = ("id", "state", "accuracy", "user_message", "inference_time", "timestamp")
+_HISTORY_SELECT = "SELECT id, state, accuracy, user_message, inference_time, timestamp FROM logs WHERE timestamp >= ?"
+_HISTORY_ORDER = " ORDER BY timestamp DESC, id DESC"
+# one fixed statement per (state filter, cursor) combination so each stays in the statement cache
+_HISTORY_SQL = {
+    (False, False): _HISTORY_SELECT + _HISTORY_ORDER,
+    (True, False): _HISTORY_SELECT + " AND state = ?" + _HISTORY_ORDER,
+    (False, True): _HISTORY_SELECT + " AND (timestamp, id) < (?, ?)" + _HISTORY_ORDER,
+    (True, True): _HISTORY_SELECT + " AND state = ? AND (timestamp, id) < (?, ?)" + _HISTORY_ORDER,
+}
+_DELETE_LOG_SQL = "DELETE FROM logs WHERE id = ?"
+_ROLLUP_FIELDS_BY_ID_SQL = "SELECT state, accuracy, inference_time, timestamp FROM logs WHERE id IN ({})"
+# ids per IN (...) lookup; stays under SQLite's default host-parameter limit
+_IDS_PER_LOOKUP = 500
+
+# optional per-row compact feature vectors (see services/feature_store.py)
+_CREATE_FEATURES_SQL = "CREATE TABLE IF NOT EXISTS log_features (log_id INTEGER PRIMARY KEY, vector BLOB NOT NULL)"
+_INSERT_FEATURE_SQL = "INSERT OR REPLACE INTO log_features (log_id, vector) VALUES (?, ?)"
+_DELETE_FEATURE_SQL = "DELETE FROM log_features WHERE log_id = ?"
+_FEATURE_BATCH_SQL = (
+    "SELECT f.log_id, f.vector, l.state, l.accuracy, l.inference_time, l.timestamp "
+    "FROM log_features f JOIN logs l ON l.id = f.log_id WHERE f.log_id > ? ORDER BY f.log_id LIMIT ?"
+)
+_UPDATE_STATE_SQL = "UPDATE logs SET state = ? WHERE id = ?"
+
+# full-text index over user_message: an external-content FTS5 table kept in sync by triggers
+_CREATE_FTS_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5("
+    "user_message, content='logs', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+)
+_CREATE_FTS_TRIGGERS_SQL = (
+    """CREATE TRIGGER IF NOT EXISTS logs_fts_insert AFTER INSERT ON logs BEGIN
+        INSERT INTO logs_fts (rowid, user_message) VALUES (new.id, new.user_message);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS logs_fts_delete AFTER DELETE ON logs BEGIN
+        INSERT INTO logs_fts (logs_fts, rowid, user_message) VALUES ('delete', old.id, old.user_message);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS logs_fts_update AFTER UPDATE OF user_message ON logs BEGIN
+        INSERT INTO logs_fts (logs_fts, rowid, user_message) VALUES ('delete', old.id, old.user_message);
+        INSERT INTO logs_fts (rowid, user_message) VALUES (new.id, new.user_message);
+    END""",
+)
+_SEARCH_SELECT = (
+    "SELECT l.id, l.state, l.accuracy, l.user_message, l.inference_time, l.timestamp, "
+    "bm25(logs_fts), snippet(logs_fts, 0, '[', ']', '...', 12) "
+    "FROM logs_fts JOIN logs l ON l.id = logs_fts.rowid "
+    "WHERE logs_fts MATCH ? AND l.timestamp >= ?"
+)
+_SEARCH_ORDER = " ORDER BY rank, l.id DESC LIMIT ? OFFSET ?"
+_SEARCH_SQL = {
+    False: _SEARCH_SELECT + _SEARCH_ORDER,
+    True: _SEARCH_SELECT + " AND l.state = ?" + _SEARCH_ORDER,
+}
+_EXPIRED_SQL = (
+    "SELECT id, state, accuracy, user_message, inference_time, timestamp FROM logs "
+    "WHERE timestamp < ? OR id <= ? ORDER BY id LIMIT ?"
+)
+# chronological range scan used by exports, resumed chunk by chunk from the last (timestamp, id)
+_RANGE_SELECT = "SELECT id, state, accuracy, user_message, inference_time, timestamp FROM logs WHERE (timestamp, id) > (?, ?) AND timestamp < ?"
+_RANGE_ORDER = " ORDER BY timestamp, id LIMIT ?"
+_RANGE_SQL = {
+    False: _RANGE_SELECT + _RANGE_ORDER,
+    True: _RANGE_SELECT + " AND state = ?" + _RANGE_ORDER,
+}
+
+_writer = None
+_readers = None       # asyncio.Queue of idle read-only connections
+_reader_conns = []
+_open_lock = None
+_write_lock = None
+_fts_available = False
+
+
+async def _connect(read_only=False):
+    if read_only:
+        uri = "file:" + urllib.parse.quote(os.path.abspath(DB_PATH)) + "?mode=ro"
+        db = await aiosqlite.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE)
+    else:
+        db = await aiosqlite.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE)
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    await db.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return db
+
+
+async def init_db(incremental_vacuum=False):
+    """
+    Create the schema and open the writer + reader pool (safe to call twice).
+    `incremental_vacuum` switches the file to incremental auto-vacuum first
+    (a one-time full VACUUM on an existing file); retention wants it.
+    """
+    global _writer, _readers, _open_lock, _write_lock, _fts_available
+    if _open_lock is None:
+        _open_lock = asyncio.Lock()
+    async with _open_lock:
+        if _writer is not None:
+            return
+        writer = await _connect()
+        if incremental_vacuum and INCREMENTAL_VACUUM:
+            await _enable_incremental_vacuum(writer)
+        await writer.execute(_CREATE_LOGS_SQL)
+        for sql in _CREATE_INDEXES_SQL:
+            await writer.execute(sql)
+        await writer.execute(_CREATE_FEATURES_SQL)
+        if await rollups.create_tables(writer):
+            # first start with rollups: fold in whatever the logs table already holds
+            await rollups.rebuild(writer)
+        _fts_available = await _create_fts(writer)
+        await writer.commit()
+        # readers are opened after the writer so the file and its WAL index exist
+        readers = asyncio.Queue()
+        for _ in range(max(1, READER_POOL_SIZE)):
+            conn = await _connect(read_only=True)
+            _reader_conns.append(conn)
+            readers.put_nowait(conn)
+        _write_lock = asyncio.Lock()
+        _readers = readers
+        _writer = writer
+
+
+async def _create_fts(db):
+    """Create the message index and its triggers; False if this SQLite build lacks FTS5."""
+    cur = await db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'logs_fts'")
+    existed = await cur.fetchone() is not None
+    await cur.close()
+    try:
+        await db.execute(_CREATE_FTS_SQL)
+    except aiosqlite.OperationalError as e:
+        json_log.event(logging.WARNING, "fts_unavailable", error=str(e))
+        return False
+    for sql in _CREATE_FTS_TRIGGERS_SQL:
+        await db.execute(sql)
+    if not existed:
+        # index messages logged before the table existed
+        await db.execute("INSERT INTO logs_fts (logs_fts) VALUES ('rebuild')")
+    return True
+
+
+async def _enable_incremental_vacuum(db):
+    cur = await db.execute("PRAGMA auto_vacuum")
+    mode = (await cur.fetchone())[0]
+    await cur.close()
+    if mode != 2:
+        # takes effect on an empty file immediately, otherwise after the (one-time) VACUUM
+        await db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        await db.execute("VACUUM")
+
+
+async def close_db():
+    """Close every pooled connection (app shutdown)."""
+    global _writer, _readers
+    if _writer is None:
+        return
+    for conn in _reader_conns:
+        await conn.close()
+    _reader_conns.clear()
+    await _writer.close()
+    _writer = None
+    _readers = None
+
+
+async def _ensure_open():
+    if _writer is None:
+        await init_db()
+
+
+@asynccontextmanager
+async def _reader():
+    await _ensure_open()
+    conn = await _readers.get()
+    try:
+        yield conn
+    finally:
+        _readers.put_nowait(conn)
 
-DB_PATH = "maitri_audio.db"
-
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS logs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                state TEXT,
-                accuracy REAL,
-                user_message TEXT,
-                inference_time REAL,
-                timestamp INTEGER
-            )
-        """)
-        await db.commit()
 
 async def insert_log(state, accuracy, user_message, inference_time):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "INSERT INTO logs (state, accuracy, user_message, inference_time, timestamp) VALUES (?, ?, ?, ?, ?)",
-            (state, accuracy, user_message, inference_time, int(time.time()))
-        )
-        await db.commit()
-
-async def get_history(hours=48):
+    await insert_logs([(state, accuracy, user_message, inference_time, int(time.time()))])
+
+
+async def insert_logs(rows):
+    """
+    Write many rows (and their rollup updates) in a single transaction.
+    rows: sequence of (state, accuracy, user_message, inference_time, timestamp[, feature_blob])
+    Rows carrying a feature blob also get a log_features entry.
+    Returns the new row ids, in the same order.
+    """
+    log_rows = [r[:5] for r in rows]
+    await _ensure_open()
+    async with _write_lock:
+        try:
+            await _writer.executemany(_INSERT_LOG_SQL, log_rows)
+            # the transaction holds the write lock, so the batch got consecutive ids
+            cur = await _writer.execute("SELECT last_insert_rowid()")
+            last_id = (await cur.fetchone())[0]
+            await cur.close()
+            ids = list(range(last_id - len(log_rows) + 1, last_id + 1))
+            features = [(i, r[5]) for i, r in zip(ids, rows) if len(r) > 5 and r[5] is not None]
+            if features:
+                await _writer.executemany(_INSERT_FEATURE_SQL, features)
+            # rollups are updated in the same transaction as the rows they summarise
+            await rollups.apply(_writer, log_rows)
+            await _writer.commit()
+        except Exception:
+            await _writer.rollback()
+            raise
+    return ids
+
+
+async def iter_history_range(start_ts, end_ts, state=None, chunk_rows=1000):
+    """
+    Yield lists of rows with start_ts <= timestamp < end_ts, oldest first.
+    Each chunk is its own short indexed query, so memory stays at one chunk
+    and a slow consumer never holds a pooled connection between chunks.
+    """
+    key = (start_ts, -1)
+    sql = _RANGE_SQL[state is not None]
+    while True:
+        params = [key[0], key[1], end_ts]
+        if state is not None:
+            params.append(state)
+        params.append(chunk_rows)
+        async with _reader() as db:
+            cur = await db.execute(sql, params)
+            rows = await cur.fetchall()
+            await cur.close()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_rows:
+            return
+        key = (rows[-1][5], rows[-1][0])
+
+
+async def iter_feature_batches(batch_rows=1024):
+    """
+    Yield lists of (log_id, vector_blob, state, accuracy, inference_time, timestamp)
+    for every stored feature vector, in log id order, one short query per batch.
+    """
+    last_id = 0
+    while True:
+        async with _reader() as db:
+            cur = await db.execute(_FEATURE_BATCH_SQL, (last_id, batch_rows))
+            rows = await cur.fetchall()
+            await cur.close()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_rows:
+            return
+        last_id = rows[-1][0]
+
+
+async def update_log_states(changes):
+    """
+    Apply re-scored states and move their rollup contributions, in one transaction.
+    changes: sequence of (log_id, old_state, new_state, accuracy, inference_time, timestamp)
+    """
+    await _ensure_open()
+    async with _write_lock:
+        try:
+            await _writer.executemany(_UPDATE_STATE_SQL, [(c[2], c[0]) for c in changes])
+            await rollups.move(
+                _writer,
+                [(c[1], c[3], c[4], c[5]) for c in changes],
+                [(c[2], c[3], c[4], c[5]) for c in changes],
+            )
+            await _writer.commit()
+        except Exception:
+            await _writer.rollback()
+            raise
+
+
+async def fetch_expired_logs(cutoff_ts, max_id, limit):
+    """
+    Oldest rows that fall outside the retention policy: older than cutoff_ts
+    or with id <= max_id (pass 0 / None to disable either rule).
+    """
+    async with _reader() as db:
+        cur = await db.execute(_EXPIRED_SQL, (cutoff_ts or 0, max_id or 0, limit))
+        rows = await cur.fetchall()
+        await cur.close()
+    return rows
+
+
+async def retention_id_threshold(keep_rows):
+    """Largest id that must go so that only the newest `keep_rows` rows remain (0 if none)."""
+    async with _reader() as db:
+        cur = await db.execute("SELECT id FROM logs ORDER BY id DESC LIMIT 1 OFFSET ?", (keep_rows,))
+        row = await cur.fetchone()
+        await cur.close()
+    return row[0] if row else 0
+
+
+async def delete_logs(ids, keep_hourly_before=0):
+    """
+    Delete rows (and their stored features) by id in one short write
+    transaction, taking them back out of the rollups. Rows older than
+    `keep_hourly_before` (age-based retention) stay counted in the hour
+    rollups; their minute rollups are pruned separately.
+    """
+    await _ensure_open()
+    async with _write_lock:
+        try:
+            # read inside the transaction, so a concurrent re-score can't change a state in between
+            stored = []
+            for start in range(0, len(ids), _IDS_PER_LOOKUP):
+                chunk = ids[start:start + _IDS_PER_LOOKUP]
+                cur = await _writer.execute(_ROLLUP_FIELDS_BY_ID_SQL.format(",".join("?" * len(chunk))), chunk)
+                stored.extend(await cur.fetchall())
+                await cur.close()
+            await rollups.remove(_writer, [r for r in stored if r[3] >= keep_hourly_before])
+            await _writer.executemany(_DELETE_LOG_SQL, [(i,) for i in ids])
+            await _writer.executemany(_DELETE_FEATURE_SQL, [(i,) for i in ids])
+            await _writer.commit()
+        except Exception:
+            await _writer.rollback()
+            raise
+
+
+async def prune_rollups(interval, before_ts):
+    await _ensure_open()
+    async with _write_lock:
+        await _writer.execute(f"DELETE FROM {rollups.table_for(interval)} WHERE bucket < ?", (before_ts,))
+        await _writer.commit()
+
+
+async def incremental_vacuum(max_pages):
+    """
+    Return up to max_pages free pages to the filesystem.
+    Returns (pages freed, pages still free).
+    """
+    await _ensure_open()
+    async with _write_lock:
+        before = await _freelist_count(_writer)
+        # the pragma frees one page per step; executescript steps it to completion
+        await _writer.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+        await _writer.commit()
+        after = await _freelist_count(_writer)
+    return before - after, after
+
+
+async def _freelist_count(db):
+    cur = await db.execute("PRAGMA freelist_count")
+    count = (await cur.fetchone())[0]
+    await cur.close()
+    return count
+
+
+async def get_rollup_summary(interval, start_ts, end_ts):
+    """Per-bucket aggregates for [start_ts, end_ts) from the `interval` rollup table."""
+    async with _reader() as db:
+        rows = await rollups.fetch_range(db, interval, start_ts, end_ts)
+    return rollups.summarize(rows)
+
+
+def fts_query(text):
+    """
+    Turn free text into an FTS5 query: every word must match, quoted so that
+    punctuation and keywords (AND, NEAR, ...) are taken literally; a trailing
+    * keeps prefix matching. Returns None when nothing searchable is left.
+    """
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', "")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms) or None
+
+
+async def search_logs(match, hours=None, state=None, limit=50, offset=0):
+    """
+    Rows whose user_message matches the FTS5 query `match`, best match first.
+    Each row is a LOG_COLUMNS tuple followed by the bm25 score (lower is better)
+    and a highlighted snippet. Returns None if full-text search is unavailable.
+    """
+    await _ensure_open()
+    if not _fts_available:
+        return None
+    cutoff = int(time.time()) - hours * 3600 if hours else 0
+    params = [match, cutoff]
+    if state is not None:
+        params.append(state)
+    params.extend((int(limit), int(offset)))
+    async with _reader() as db:
+        cur = await db.execute(_SEARCH_SQL[state is not None], params)
+        rows = await cur.fetchall()
+        await cur.close()
+    return rows
+
+
+def encode_cursor(row):
+    """Opaque page cursor pointing just past `row` (a LOG_COLUMNS tuple)."""
+    raw = f"{row[5]}:{row[0]}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on anything malformed."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    ts, row_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii").split(":")
+    return int(ts), int(row_id)
+
+
+async def get_history(hours=48, limit=None, cursor=None, state=None):
+    """
+    Rows newest first. With `limit`, returns at most that many rows; pass the
+    (timestamp, id) of the last row seen as `cursor` to get the next page.
+    Both paths walk the (timestamp, id) indexes, so a page costs O(limit).
+    """
     cutoff = int(time.time()) - hours * 3600
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "SELECT id, state, accuracy, user_message, inference_time, timestamp FROM logs WHERE timestamp >= ? ORDER BY timestamp DESC",
-            (cutoff,)
-        )
+    params = [cutoff]
+    if state is not None:
+        params.append(state)
+    if cursor is not None:
+        params.extend(cursor)
+    sql = _HISTORY_SQL[(state is not None, cursor is not None)]
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    async with _reader() as db:
+        cur = await db.execute(sql, params)
         rows = await cur.fetchall()
+        await cur.close()
     return rows
@@ -0,0 +1,242 @@
+# database/rollups.py
+"""
+Per-minute and per-hour rollups of the logs table.
+
+Each rollup row covers one (bucket, state) pair and keeps the count,
+accuracy / inference-time sums and a small latency sketch, so dashboard
+aggregates are answered from O(buckets) rows instead of scanning logs.
+apply() is called by db.insert_logs inside the same transaction as the
+rows it summarises, and remove() by db.delete_logs, so rollups agree with
+the raw table. The one deliberate exception: hour rollups keep the rows
+age-based retention deleted (minute rollups for them are pruned), so
+/history/summary reaches further back than /history.
+
+The latency sketch is a sparse log-scale histogram: bin i covers
+[SKETCH_MIN * GROWTH**(i-1), SKETCH_MIN * GROWTH**i), which bounds the
+relative error of any quantile to about GROWTH - 1 (~12%).
+"""
+import math
+import struct
+
+INTERVALS = {"minute": 60, "hour": 3600}
+
+SKETCH_MIN = 1e-4       # seconds; everything faster lands in bin 0
+SKETCH_GROWTH = 1.25
+SKETCH_BINS = 80        # top bin starts around 1e-4 * 1.25**79 ~ 4.5 hours
+_LOG_GROWTH = math.log(SKETCH_GROWTH)
+_PAIR = struct.Struct("<HI")
+
+_CREATE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        bucket INTEGER NOT NULL,
+        state TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        sum_accuracy REAL NOT NULL,
+        sum_inference_time REAL NOT NULL,
+        latency_sketch BLOB,
+        PRIMARY KEY (bucket, state)
+    ) WITHOUT ROWID
+"""
+_SELECT_SKETCH_SQL = "SELECT latency_sketch FROM {table} WHERE bucket = ? AND state = ?"
+_UPSERT_SQL = """
+    INSERT INTO {table} (bucket, state, count, sum_accuracy, sum_inference_time, latency_sketch)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (bucket, state) DO UPDATE SET
+        count = count + excluded.count,
+        sum_accuracy = sum_accuracy + excluded.sum_accuracy,
+        sum_inference_time = sum_inference_time + excluded.sum_inference_time,
+        latency_sketch = excluded.latency_sketch
+"""
+_RANGE_SQL = (
+    "SELECT bucket, state, count, sum_accuracy, sum_inference_time, latency_sketch "
+    "FROM {table} WHERE bucket >= ? AND bucket < ? ORDER BY bucket"
+)
+
+
+def table_for(interval):
+    return f"rollup_{interval}"
+
+
+# --- latency sketch -------------------------------------------------------
+
+def sketch_bin(seconds):
+    if seconds is None or seconds < SKETCH_MIN:
+        return 0
+    return min(SKETCH_BINS - 1, int(math.log(seconds / SKETCH_MIN) / _LOG_GROWTH) + 1)
+
+
+def encode_sketch(counts):
+    """{bin: count} -> compact blob of (uint16 bin, uint32 count) pairs."""
+    return b"".join(_PAIR.pack(b, c) for b, c in sorted(counts.items()) if c > 0)
+
+
+def decode_sketch(blob):
+    counts = {}
+    if blob:
+        for b, c in _PAIR.iter_unpack(blob):
+            counts[b] = c
+    return counts
+
+
+def merge_sketch(into, other):
+    for b, c in other.items():
+        into[b] = into.get(b, 0) + c
+    return into
+
+
+def sketch_quantile(counts, q):
+    total = sum(counts.values())
+    if total == 0:
+        return 0.0
+    rank = q * (total - 1)
+    seen = 0
+    for b in sorted(counts):
+        seen += counts[b]
+        if seen > rank:
+            if b == 0:
+                return SKETCH_MIN
+            # geometric midpoint of the bin
+            return SKETCH_MIN * SKETCH_GROWTH ** (b - 0.5)
+    return SKETCH_MIN * SKETCH_GROWTH ** (SKETCH_BINS - 1)
+
+
+# --- maintenance (called inside the writer's transaction) ------------------
+
+async def create_tables(db):
+    """Create rollup tables; returns True if they did not exist before."""
+    cur = await db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (table_for("minute"),))
+    existed = await cur.fetchone() is not None
+    await cur.close()
+    for interval in INTERVALS:
+        await db.execute(_CREATE_SQL.format(table=table_for(interval)))
+    return not existed
+
+
+def _aggregate(rows, sign=1):
+    """
+    Group (state, accuracy, inference_time, timestamp) tuples per interval/bucket/state.
+    sign=-1 builds the negative contribution used to move rows out of a state.
+    """
+    groups = {}
+    for state, accuracy, inference_time, timestamp in rows:
+        state = state or "Unknown"
+        for interval, width in INTERVALS.items():
+            key = (interval, timestamp - timestamp % width, state)
+            g = groups.get(key)
+            if g is None:
+                g = groups[key] = [0, 0.0, 0.0, {}]
+            g[0] += sign
+            g[1] += sign * (accuracy or 0.0)
+            g[2] += sign * (inference_time or 0.0)
+            b = sketch_bin(inference_time)
+            g[3][b] = g[3].get(b, 0) + sign
+    return groups
+
+
+async def _upsert(db, groups):
+    for (interval, bucket, state), (count, sum_acc, sum_inf, sketch) in groups.items():
+        table = table_for(interval)
+        cur = await db.execute(_SELECT_SKETCH_SQL.format(table=table), (bucket, state))
+        existing = await cur.fetchone()
+        await cur.close()
+        merged = merge_sketch(decode_sketch(existing[0]) if existing else {}, sketch)
+        await db.execute(
+            _UPSERT_SQL.format(table=table),
+            (bucket, state, count, sum_acc, sum_inf, encode_sketch(merged)),
+        )
+
+
+async def apply(db, rows):
+    """
+    Fold freshly inserted log rows into the rollups.
+    rows: iterable of (state, accuracy, user_message, inference_time, timestamp), as inserted.
+    """
+    await _upsert(db, _aggregate((r[0], r[1], r[3], r[4]) for r in rows))
+
+
+async def move(db, old_rows, new_rows):
+    """
+    Re-attribute rows whose state changed (e.g. after a re-score).
+    old_rows / new_rows: matching (state, accuracy, inference_time, timestamp) tuples.
+    """
+    groups = _aggregate(old_rows, sign=-1)
+    for key, (count, sum_acc, sum_inf, sketch) in _aggregate(new_rows).items():
+        g = groups.get(key)
+        if g is None:
+            groups[key] = [count, sum_acc, sum_inf, sketch]
+        else:
+            g[0] += count
+            g[1] += sum_acc
+            g[2] += sum_inf
+            merge_sketch(g[3], sketch)
+    await _upsert(db, groups)
+
+
+async def remove(db, rows):
+    """
+    Take deleted rows back out of the rollups; buckets left empty are dropped.
+    rows: (state, accuracy, inference_time, timestamp) tuples, as they were stored.
+    """
+    groups = _aggregate(rows, sign=-1)
+    await _upsert(db, groups)
+    for interval in INTERVALS:
+        buckets = [bucket for (i, bucket, _) in groups if i == interval]
+        if buckets:
+            await db.execute(
+                f"DELETE FROM {table_for(interval)} WHERE bucket >= ? AND bucket <= ? AND count <= 0",
+                (min(buckets), max(buckets)),
+            )
+
+
+async def rebuild(db, chunk_rows=5000):
+    """Recompute all rollups from logs (used once when the tables are first created)."""
+    for interval in INTERVALS:
+        await db.execute(f"DELETE FROM {table_for(interval)}")
+    last_id = 0
+    while True:
+        cur = await db.execute(
+            "SELECT id, state, accuracy, inference_time, timestamp FROM logs WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, chunk_rows),
+        )
+        rows = await cur.fetchall()
+        await cur.close()
+        if not rows:
+            return
+        await _upsert(db, _aggregate(r[1:] for r in rows))
+        last_id = rows[-1][0]
+
+
+# --- reads ------------------------------------------------------------------
+
+async def fetch_range(db, interval, start_ts, end_ts):
+    table = table_for(interval)
+    width = INTERVALS[interval]
+    cur = await db.execute(_RANGE_SQL.format(table=table), (start_ts - start_ts % width, end_ts))
+    rows = await cur.fetchall()
+    await cur.close()
+    return rows
+
+
+def summarize(rows):
+    """Collapse (bucket, state, ...) rollup rows into one summary dict per bucket."""
+    buckets = []
+    current = None
+    for bucket, state, count, sum_acc, sum_inf, blob in rows:
+        if current is None or current["bucket"] != bucket:
+            current = {"bucket": bucket, "counts": {}, "total": 0, "_acc": 0.0, "_inf": 0.0, "_sketch": {}}
+            buckets.append(current)
+        if count <= 0:
+            continue
+        current["counts"][state] = count
+        current["total"] += count
+        current["_acc"] += sum_acc
+        current["_inf"] += sum_inf
+        merge_sketch(current["_sketch"], decode_sketch(blob))
+    for b in buckets:
+        total = b["total"]
+        acc, inf, sketch = b.pop("_acc"), b.pop("_inf"), b.pop("_sketch")
+        b["avg_accuracy"] = round(acc / total, 4) if total else 0.0
+        b["avg_inference_time"] = round(inf / total, 6) if total else 0.0
+        b["p50_inference_time"] = round(sketch_quantile(sketch, 0.50), 6)
+        b["p95_inference_time"] = round(sketch_quantile(sketch, 0.95), 6)
+    return [b for b in buckets if b["total"] > 0]
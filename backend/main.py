@@ -1,97 +1,692 @@
 # main.py
+import os
 import time
+import json
 import asyncio
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+import hashlib
+import logging
+from typing import List, Optional
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Request, Response, WebSocket
 from concurrent.futures import ThreadPoolExecutor
 
 # audio preprocessing helper you created earlier
-from .services.audio_service import make_model_input
+from .services.audio_service import make_model_input, make_model_input_from_pcm, PCM_FORMATS, TARGET_SR, HOP_LENGTH
 
 # teammate's function (they implement the ML logic here)
-from .models.model_function import run_emotion_model
+from .models.model_function import run_emotion_model, run_emotion_model_batch, compact_features, model_version, is_deterministic, JITTER_MODE
+
+# priority/deadline-aware front for the thread pool
+from .services.scheduler import PriorityScheduler, DeadlineExceeded, PRIORITY_CLASSES, DEFAULT_PRIORITY
+
+# shares one computation between concurrent identical uploads
+from .services.singleflight import SingleFlight
+
+# results of audio we've already scored, keyed by content hash
+from .services.result_cache import ResultCache
+
+# size limit enforced while the body streams in + container sniffing
+from .services.upload_limits import (
+    UploadLimitMiddleware, UploadTooLarge, MAX_UPLOAD_BYTES, MAX_BATCH_UPLOAD_BYTES, SNIFF_BYTES, sniff_audio_format,
+)
+
+# per-client token buckets, checked before an upload is read
+from .services.rate_limit import RateLimitMiddleware, TokenBuckets, parse_overrides, RATE_LIMIT_OVERRIDES
+
+# 503 for anything arriving after shutdown started
+from .services.drain import DrainMiddleware, DrainState
 
 # optional DB logging helpers
-from .database.db import init_db, insert_log, get_history
+from .database.db import (
+    init_db, close_db, insert_logs, get_history, iter_history_range, get_rollup_summary,
+    search_logs, fts_query, encode_cursor, decode_cursor, LOG_COLUMNS,
+)
+from .database.rollups import INTERVALS as ROLLUP_INTERVALS
+
+# JSON (orjson when installed) or MessagePack bodies written straight from row tuples
+from .services.response_encoding import Rows, encoded_response
+
+# streaming NDJSON/CSV writers for /history/export
+from .services.history_export import export_body, EXPORT_FORMATS, COLUMNAR_FORMATS
+
+# batches DB log rows in the background instead of one task + transaction per request
+from .services.log_writer import LogWriter
+
+# age/row-count retention with batched deletes and incremental vacuum
+from .services.retention import RetentionJob
+
+# recent classifications kept in memory for the common /history calls
+from .services.recent_buffer import RecentBuffer
+
+# Prometheus-format counters and per-stage latency histograms
+from .services.metrics import MetricsMiddleware, timed, observe_stage, process_rss_bytes, gauge_lines, render as render_metrics
+
+# Server-Timing / X-Request-ID on /classify responses, and JSON log lines written off the event loop
+from .services.request_timing import RequestTimingMiddleware, note as note_request
+from .services import json_log
+from .services.json_log import log
+
+# Binary format for features computed on edge stations
+from .services.feature_codec import decode_features, feature_config, FeatureFormatError, FEATURE_CONTENT_TYPE
+
+# Incremental per-connection features for /ws/stream
+from .services.stream_features import StreamingFeatures, window_features
+
+# Compact per-log feature vectors and bulk re-scoring against the current model
+from .services.feature_store import RescoreJob, encode_vector, FEATURE_STORE_ENABLED
 
 # Allow frontend (localhost) to call this backend during development
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
 app = FastAPI(title="MAITRI - Audio classify API")
 
+# Refuse oversized uploads before (or while) the multipart body is spooled
+app.add_middleware(
+    UploadLimitMiddleware,
+    path_prefix="/classify",
+    max_bytes=MAX_UPLOAD_BYTES,
+    path_limits={"/classify/batch": MAX_BATCH_UPLOAD_BYTES},
+)
+
+# Off unless MAITRI_RATE_LIMIT_RPS / MAITRI_RATE_LIMIT_OVERRIDES are set; see services/rate_limit.py
+rate_limits = TokenBuckets(overrides=parse_overrides(RATE_LIMIT_OVERRIDES))
+app.add_middleware(RateLimitMiddleware, buckets=rate_limits, path_prefix="/classify")
+
+# Set at the start of shutdown, before the scheduler and log writer are drained
+drain_state = DrainState()
+app.add_middleware(DrainMiddleware, state=drain_state)
+
+# Outside the upload limit, rate limit and drain refusals, so those are counted too
+app.add_middleware(MetricsMiddleware)
+
+# Per-stage durations for each /classify request (header + one "request" log line)
+app.add_middleware(RequestTimingMiddleware, path_prefix="/classify")
+
+# Added last, so it is the outermost layer: the 413/429/503 refusals above carry
+# CORS headers too and reach the browser as errors it can read
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],    # during dev: allow any origin. In production, restrict this.
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Request-ID"],
 )
 
+# chunk size used when hashing the spooled upload
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+# seconds shutdown waits for queued/running inference jobs, then for the log queue
+DRAIN_TIMEOUT_S = float(os.environ.get("MAITRI_DRAIN_TIMEOUT_S", "20"))
+
 # Use a thread pool so heavy CPU work inside run_emotion_model doesn't block the event loop
-executor = ThreadPoolExecutor(max_workers=2)
+MAX_WORKERS = 2
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+# Interactive recordings are served before batch/evaluation traffic; see services/scheduler.py
+scheduler = PriorityScheduler(executor, MAX_WORKERS)
+
+# In-flight map keyed by audio content hash, layered in front of the scheduler
+inflight = SingleFlight()
+
+# Repeat uploads (retries, re-analysis) are answered without decoding again
+result_cache = ResultCache()
+
+# Last few thousand logged rows, filled as each log batch commits
+recent = RecentBuffer()
+
+
+def _remember_written(rows, ids):
+    # rows may carry a trailing feature blob; the buffer keeps LOG_COLUMNS only
+    recent.extend((row_id,) + tuple(row[:5]) for row_id, row in zip(ids, rows))
+
+
+# Single background task draining log rows into SQLite in batches
+log_writer = LogWriter(insert_logs, on_written=_remember_written)
+
+# Keeps maitri_audio.db bounded on long missions (disabled unless configured)
+retention = RetentionJob(on_delete=lambda ids: recent.drop_through(max(ids)))
+
+# Re-scores stored feature vectors at batch priority; buffered rows may carry old states afterwards
+rescore = RescoreJob(
+    lambda fn, *args: scheduler.submit(fn, *args, priority="batch"),
+    on_changed=recent.reset,
+)
+
+
+def _runs_background_jobs():
+    # run_production.py lets only one of its worker processes run retention
+    return os.environ.get("MAITRI_BACKGROUND_JOBS", "1") != "0"
+
+
+class AudioPreprocessError(Exception):
+    """Raised from the worker thread when an upload can't be turned into features."""
+
 
 @app.on_event("startup")
 async def startup():
-    # initialize DB table (safe if already exists)
-    # Temporarily disabled for debugging crashes
-    # await init_db()
-    print("Startup complete — DB initialization skipped for debugging.")
+    # initialize DB table (safe if already exists) and open the pooled connections;
+    # logging is optional, so a DB problem must not stop the API from serving
+    json_log.start()
+    drain_state.draining = False
+    try:
+        # the one-time VACUUM into incremental auto-vacuum is only worth it if retention runs here
+        await init_db(incremental_vacuum=retention.enabled and _runs_background_jobs())
+        log.info("startup_complete")
+    except Exception as e:
+        json_log.event(logging.WARNING, "db_init_failed", error=str(e))
+    log_writer.start()
+    if _runs_background_jobs():
+        retention.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # uvicorn has stopped accepting connections and waited for in-flight
+    # requests; refuse stragglers, then let queued work finish
+    drain_state.draining = True
+    t0 = time.perf_counter()
+    await rescore.stop()
+    await retention.stop()
+    jobs_drained, jobs_aborted = await scheduler.drain(DRAIN_TIMEOUT_S)
+    # flush whatever is still queued before the connections go away
+    written_before = log_writer.written
+    lost = await log_writer.stop(timeout=DRAIN_TIMEOUT_S)
+    json_log.event(
+        logging.WARNING if jobs_aborted or lost or drain_state.requests_aborted else logging.INFO, "shutdown_drained",
+        requests_aborted=drain_state.requests_aborted,
+        jobs_drained=jobs_drained,
+        jobs_aborted=jobs_aborted,
+        log_rows_written=log_writer.written - written_before,
+        log_rows_lost=lost,
+        seconds=round(time.perf_counter() - t0, 3),
+    )
+    await close_db()
+    json_log.stop()
+
+def _resolve_scheduling(priority_field, deadline_field, priority_header, deadline_header):
+    """
+    Pick priority class and absolute deadline for a request.
+    Form fields win over headers; the deadline is a budget in milliseconds
+    counted from the moment the request reached the handler.
+    """
+    priority = (priority_field or priority_header or DEFAULT_PRIORITY).strip().lower()
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"Unknown priority '{priority}', expected one of {sorted(PRIORITY_CLASSES)}")
+    raw_deadline = deadline_field if deadline_field not in (None, "") else deadline_header
+    if raw_deadline in (None, ""):
+        return priority, None
+    try:
+        budget_ms = float(raw_deadline)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="deadline_ms must be a number of milliseconds")
+    return priority, time.monotonic() + budget_ms / 1000.0
+
 
 @app.post("/classify")
-async def classify(audio: UploadFile = File(...), message: str = Form("")):
+async def classify(
+    response: Response,
+    audio: UploadFile = File(...),
+    message: str = Form(""),
+    priority: Optional[str] = Form(None),
+    deadline_ms: Optional[str] = Form(None),
+    x_priority: Optional[str] = Header(None),
+    x_deadline_ms: Optional[str] = Header(None),
+):
     """
     Receives multipart/form-data with:
       - audio: file (field name "audio")
       - message: optional text
+      - priority: optional "interactive" (default) or "batch" (or X-Priority header)
+      - deadline_ms: optional time budget; the request is dropped with 504 if no
+        worker picks it up in time (or X-Deadline-Ms header)
     Workflow:
-      1) read bytes
-      2) preprocess -> features (make_model_input)
-      3) call teammate's run_emotion_model(features) inside a threadpool
-      4) asynchronously log to DB
-      5) return the teammate's JSON: {"state": "...", "accuracy": ...}
+      1) sniff the container header and hash the spooled upload in chunks
+      2) preprocess -> features (make_model_input) and call teammate's
+         run_emotion_model(features) inside the scheduled threadpool
+      3) asynchronously log to DB
+      4) return the teammate's JSON: {"state": "...", "accuracy": ...}
     """
     try:
+        prio, deadline = _resolve_scheduling(priority, deadline_ms, x_priority, x_deadline_ms)
+
         # 1) Basic validation
         if not audio or not audio.filename:
             raise HTTPException(status_code=400, detail="No audio file uploaded under field 'audio'")
 
-        # 2) Read uploaded bytes (small files ok to hold in memory)
-        audio_bytes = await audio.read()
-        if not audio_bytes:
-            raise HTTPException(status_code=400, detail="Audio file is empty")
+        # 2) Validate the container from the first bytes, then hash the rest in
+        #    chunks; the upload stays in its spooled file, never copied whole
+        content_hash = await _hash_upload(audio)
+        audio.file.seek(0)
 
-        # 3) Preprocess to features (this is synchronous CPU work but fast)
-        try:
-            features = make_model_input(audio_bytes)
-        except Exception as e:
-            # bad input or preprocessing error -> return 400
-            print(f"[ERROR] Audio preprocessing failed: {e}")
-            raise HTTPException(status_code=400, detail=f"Audio preprocessing failed: {str(e)[:100]}")
+        # 3) Preprocess + run the model on the threadpool, interactive work first.
+        #    Audio we've already scored is answered from the result cache, and
+        #    concurrent uploads of the same audio share a single computation.
+        result = await _cached_classification(content_hash, prio, deadline, classify_audio_sync, audio.file)
 
-        # 4) Call teammate's model function inside threadpool (avoid blocking)
-        loop = asyncio.get_running_loop()
-        result = await loop.run_in_executor(executor, call_teammate_sync, features)
+        # 4) Optionally log result to DB without blocking the response
+        _log_result(result, message)
 
-        # 5) Optionally log result to DB without blocking the response
-        try:
-            asyncio.create_task(insert_log(result.get("state"), result.get("accuracy"), message, result.get("inference_time", 0.0)))
-        except Exception as log_err:
-            # logging failure should not break the response
-            print(f"[WARN] DB logging failed (non-critical): {log_err}")
-
-        # 6) Return emotion and confidence for frontend consumption
-        return {
-            "emotion": result.get("state", "Unknown"),
-            "confidence": result.get("accuracy", 0.0)
-        }
+        # 5) Return emotion and confidence for frontend consumption
+        _set_cache_headers(response, content_hash)
+        return _classification_response(result)
     except HTTPException:
         # Re-raise HTTP exceptions (already properly formatted)
         raise
     except Exception as e:
         # Catch any unexpected errors and return 500 without crashing
-        print(f"[ERROR] Unhandled exception in /classify: {e}")
+        log.exception("classify_failed")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
-def call_teammate_sync(features):
+PCM_MAX_SAMPLE_RATE = 192000
+# below this the linear resampler turns a small body into a huge 16 kHz signal
+PCM_MIN_SAMPLE_RATE = 8000
+
+
+@app.post("/classify/raw")
+async def classify_raw(
+    request: Request,
+    response: Response,
+    message: str = "",
+    priority: Optional[str] = None,
+    deadline_ms: Optional[str] = None,
+    x_sample_rate: Optional[int] = Header(None),
+    x_channels: int = Header(1),
+    x_sample_format: str = Header("s16le"),
+    x_priority: Optional[str] = Header(None),
+    x_deadline_ms: Optional[str] = Header(None),
+):
+    """
+    Classify raw PCM without multipart or a container.
+    Body: application/octet-stream of interleaved little-endian samples.
+    Headers:
+      - X-Sample-Rate: required, in Hz (8000 to 192000)
+      - X-Channels: default 1 (mixed down to mono)
+      - X-Sample-Format: "s16le" (default) or "f32le"
+    message / priority / deadline_ms are query parameters (or the usual
+    X-Priority / X-Deadline-Ms headers). Returns the same body as /classify.
+    """
+    prio, deadline = _resolve_scheduling(priority, deadline_ms, x_priority, x_deadline_ms)
+    content_type = request.headers.get("content-type", "")
+    if content_type.split(";")[0].strip().lower() != "application/octet-stream":
+        raise HTTPException(status_code=415, detail="Send the PCM samples as application/octet-stream")
+    if x_sample_format not in PCM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"X-Sample-Format must be one of {sorted(PCM_FORMATS)}")
+    if x_sample_rate is None or not PCM_MIN_SAMPLE_RATE <= x_sample_rate <= PCM_MAX_SAMPLE_RATE:
+        raise HTTPException(
+            status_code=400, detail=f"X-Sample-Rate must be between {PCM_MIN_SAMPLE_RATE} and {PCM_MAX_SAMPLE_RATE}",
+        )
+    if x_channels < 1:
+        raise HTTPException(status_code=400, detail="X-Channels must be at least 1")
+
+    # bounded by UploadLimitMiddleware like every /classify body
+    with timed("upload_read"):
+        pcm = await request.body()
+    frame_bytes = PCM_FORMATS[x_sample_format].itemsize * x_channels
+    if not pcm or len(pcm) % frame_bytes:
+        raise HTTPException(status_code=400, detail=f"Body must be a non-empty whole number of {frame_bytes}-byte frames")
+
+    # the layout is part of the key: the same bytes read as another format are different audio
+    digest = hashlib.sha256(f"pcm:{x_sample_format}:{x_sample_rate}:{x_channels}:".encode("ascii"))
+    digest.update(pcm)
+    content_hash = digest.hexdigest()
+
+    result = await _cached_classification(
+        content_hash, prio, deadline, classify_pcm_sync, pcm, x_sample_rate, x_channels, x_sample_format,
+    )
+    _log_result(result, message)
+    _set_cache_headers(response, content_hash)
+    return _classification_response(result)
+
+
+@app.post("/classify/features")
+async def classify_features(
+    request: Request,
+    response: Response,
+    message: str = "",
+    priority: Optional[str] = None,
+    deadline_ms: Optional[str] = None,
+    x_priority: Optional[str] = Header(None),
+    x_deadline_ms: Optional[str] = Header(None),
+):
+    """
+    Classify log-mel features computed on the client (tools/feature_client.py)
+    instead of audio. Body: the services/feature_codec.py format, sent as
+    application/x-maitri-features (or application/octet-stream). Features
+    computed with a different config or feature version are refused with 422;
+    see GET /classify/features/config. Returns the same body as /classify.
+    """
+    prio, deadline = _resolve_scheduling(priority, deadline_ms, x_priority, x_deadline_ms)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in (FEATURE_CONTENT_TYPE, "application/octet-stream"):
+        raise HTTPException(status_code=415, detail=f"Send features as {FEATURE_CONTENT_TYPE}")
+    with timed("upload_read"):
+        blob = await request.body()
+    content_hash = hashlib.sha256(b"features:" + blob).hexdigest()
+    try:
+        # decoding (and inflating) runs on the worker, not the event loop
+        result = await _cached_classification(content_hash, prio, deadline, classify_features_sync, blob)
+    except FeatureFormatError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    _log_result(result, message)
+    _set_cache_headers(response, content_hash)
+    return _classification_response(result)
+
+
+@app.get("/classify/features/config")
+async def classify_features_config():
+    """Feature config clients must match when sending to /classify/features."""
+    return feature_config()
+
+
+BATCH_MAX_FILES = 256
+# files per executor job: big enough to amortise scheduling, small enough to keep both workers busy
+BATCH_CHUNK_FILES = 16
+
+
+@app.post("/classify/batch")
+async def classify_batch(
+    audio: List[UploadFile] = File(...),
+    message: str = Form(""),
+    priority: Optional[str] = Form(None),
+    deadline_ms: Optional[str] = Form(None),
+    stream: bool = Form(False),
+    x_priority: Optional[str] = Header(None),
+    x_deadline_ms: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None),
+):
+    """
+    Classify many files in one multipart request (repeat the "audio" field).
+    Priority (form field or X-Priority header) defaults to "batch". Files are decoded and scored in chunks of
+    BATCH_CHUNK_FILES per executor job, each chunk with a single matrix
+    product; results already in the result cache are answered directly.
+    Returns {"results": [...]} in request order. Each item has "index" and
+    "filename", plus either "emotion" / "confidence" or "error" / "status"
+    (a bad file fails alone, not the whole batch). With stream=true the items
+    are sent as NDJSON lines as soon as their chunk completes; otherwise
+    `Accept: application/msgpack` gets the same body as MessagePack.
+    """
+    # "batch" only when neither the form field nor the X-Priority header says otherwise
+    prio, deadline = _resolve_scheduling(priority or x_priority or "batch", deadline_ms, None, x_deadline_ms)
+    if len(audio) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_FILES} files per batch")
+
+    results = [None] * len(audio)
+    pending = {}            # content hash -> indices of the uploads still to score
+    for i, upload in enumerate(audio):
+        item = {"index": i, "filename": upload.filename}
+        try:
+            content_hash = await _hash_upload(upload)
+        except HTTPException as e:
+            results[i] = {**item, "error": e.detail, "status": e.status_code}
+            continue
+        upload.file.seek(0)
+        cached = result_cache.get(content_hash)
+        if cached is not None:
+            results[i] = {**item, **_classification_response(cached)}
+            _log_result(cached, message)
+        else:
+            pending.setdefault(content_hash, []).append(i)
+
+    # identical uploads within the batch are scored once
+    hashes = list(pending)
+    chunks = [hashes[k:k + BATCH_CHUNK_FILES] for k in range(0, len(hashes), BATCH_CHUNK_FILES)]
+
+    async def run_chunk(chunk):
+        sources = [audio[pending[h][0]].file for h in chunk]
+        try:
+            outcomes = await scheduler.submit(classify_batch_sync, sources, chunk, priority=prio, deadline=deadline)
+        except DeadlineExceeded:
+            outcomes = [DeadlineExceeded()] * len(chunk)
+        done = []
+        for content_hash, outcome in zip(chunk, outcomes):
+            for i in pending[content_hash]:
+                item = {"index": i, "filename": audio[i].filename}
+                if isinstance(outcome, DeadlineExceeded):
+                    results[i] = {**item, "error": "Deadline exceeded before the file could be processed", "status": 504}
+                elif isinstance(outcome, AudioPreprocessError):
+                    results[i] = {**item, "error": f"Audio preprocessing failed: {str(outcome)[:100]}", "status": 400}
+                else:
+                    results[i] = {**item, **_classification_response(outcome)}
+                    _log_result(outcome, message)
+                done.append(results[i])
+            if not isinstance(outcome, Exception) and outcome.get("state") != "Unknown":
+                result_cache.put(content_hash, outcome)
+        return done
+
+    tasks = [asyncio.ensure_future(run_chunk(chunk)) for chunk in chunks]
+    if not stream:
+        await asyncio.gather(*tasks)
+        return encoded_response({"results": results}, accept)
+
+    async def body():
+        # answered-up-front items first, then each chunk as it finishes
+        for item in results:
+            if item is not None:
+                yield json.dumps(item) + "\n"
+        for finished in asyncio.as_completed(tasks):
+            for item in await finished:
+                yield json.dumps(item) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@app.post("/classify/by-hash")
+async def classify_by_hash(response: Response, sha256: str = Form(...), message: str = Form("")):
+    """
+    Lets a client skip the upload for audio the server has already scored.
+    Send the hex SHA-256 of the exact file bytes you would upload to /classify:
+      - hit  -> 200 with the same body /classify would return (and the entry is logged)
+      - miss -> 404; upload the file to /classify as usual
+    """
+    content_hash = _parse_content_hash(sha256)
+    result = result_cache.get(content_hash)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Audio not known to the server; upload it to /classify")
+    _log_result(result, message)
+    _set_cache_headers(response, content_hash)
+    return _classification_response(result)
+
+
+@app.get("/results/{sha256}")
+async def cached_result(sha256: str, if_none_match: Optional[str] = Header(None)):
+    """
+    Read-only, HTTP-cacheable view of a previously computed result (not logged).
+    In deterministic mode (MAITRI_JITTER=hash|off) the response carries an ETag
+    and answers 304 to a matching If-None-Match.
+    """
+    content_hash = _parse_content_hash(sha256)
+    etag = _etag_for(content_hash)
+    if etag is not None and if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        response = Response(status_code=304)
+        _set_cache_headers(response, content_hash)
+        return response
+    result = result_cache.get(content_hash)
+    if result is None:
+        raise HTTPException(status_code=404, detail="No result for this audio; upload it to /classify")
+    response = JSONResponse(_classification_response(result))
+    _set_cache_headers(response, content_hash)
+    return response
+
+
+async def _hash_upload(audio: UploadFile):
+    """
+    SHA-256 of an upload, read chunk by chunk from its spooled file.
+    Rejects empty, non-audio (by magic bytes) and oversized uploads along the way.
+    """
+    with timed("upload_read"):
+        return await _hash_upload_chunks(audio)
+
+
+async def _hash_upload_chunks(audio: UploadFile):
+    head = await audio.read(SNIFF_BYTES)
+    if not head:
+        raise HTTPException(status_code=400, detail="Audio file is empty")
+    if sniff_audio_format(head) is None:
+        raise HTTPException(status_code=415, detail="Unsupported audio format; expected WAV, FLAC, OGG or AIFF")
+    digest = hashlib.sha256(head)
+    total = len(head)
+    while True:
+        chunk = await audio.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > MAX_UPLOAD_BYTES:
+            raise UploadTooLarge(MAX_UPLOAD_BYTES)
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _parse_content_hash(value):
+    content_hash = value.strip().lower()
+    if len(content_hash) != 64 or any(c not in "0123456789abcdef" for c in content_hash):
+        raise HTTPException(status_code=400, detail="sha256 must be a 64-character hex digest")
+    return content_hash
+
+
+def _etag_for(content_hash):
+    """
+    Strong ETag for a result, or None while results still carry random jitter.
+    Includes the model fingerprint and jitter mode so a signature update or
+    mode switch invalidates clients' copies.
+    """
+    if not is_deterministic():
+        return None
+    return f'"{content_hash[:32]}-{model_version()}-{JITTER_MODE}"'
+
+
+def _set_cache_headers(response, content_hash):
+    etag = _etag_for(content_hash)
+    if etag is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, max-age=3600"
+
+
+async def _cached_classification(content_hash, prio, deadline, fn, *args):
+    """
+    Result for `content_hash` from the cache, or from fn(*args, content_hash)
+    on the scheduler - coalesced with any identical request already running.
+    """
+    result = result_cache.get(content_hash)
+    if result is not None:
+        note_request("cache", "hit")
+        return result
+    note_request("cache", "coalesced" if content_hash in inflight else "miss")
+    while True:
+        if content_hash in inflight:
+            # the shared job must not be served later, or dropped sooner, than this caller asked for
+            scheduler.escalate(content_hash, prio, deadline)
+        try:
+            return await inflight.do(
+                content_hash,
+                lambda: _compute_and_cache(content_hash, prio, deadline, fn, *args),
+            )
+        except AudioPreprocessError as e:
+            # bad input or preprocessing error -> return 400
+            json_log.event(logging.WARNING, "audio_preprocess_failed", error=str(e))
+            raise HTTPException(status_code=400, detail=f"Audio preprocessing failed: {str(e)[:100]}")
+        except DeadlineExceeded:
+            # a shared job dropped for a stricter caller's deadline (e.g. joined
+            # before it reached the queue): try again on this caller's own terms
+            if deadline is not None and time.monotonic() >= deadline:
+                raise HTTPException(status_code=504, detail="Deadline exceeded before the request could be processed")
+
+
+async def _compute_and_cache(content_hash, prio, deadline, fn, *args):
+    result = await scheduler.submit(fn, *args, content_hash, priority=prio, deadline=deadline, key=content_hash)
+    # don't pin the safe-default answer from a crashed model call
+    if result.get("state") != "Unknown":
+        result_cache.put(content_hash, result)
+    return result
+
+
+def _log_result(result, message):
+    # queued for the background writer; a full queue drops the row (counted), never the response
+    log_writer.submit((
+        result.get("state"), result.get("accuracy"), message, result.get("inference_time", 0.0), int(time.time()),
+        result.get("feature_blob"),
+    ))
+
+
+def _classification_response(result):
+    return {
+        "emotion": result.get("state", "Unknown"),
+        "confidence": result.get("accuracy", 0.0)
+    }
+
+
+def classify_audio_sync(audio_source, content_hash=None):
+    """
+    Worker-thread job for /classify: preprocess the upload (bytes or an open
+    file), then run the model.
+    Preprocessing failures are re-raised as AudioPreprocessError so the
+    handler can answer 400 instead of 500.
+    """
+    try:
+        features = make_model_input(audio_source)
+    except Exception as e:
+        raise AudioPreprocessError(str(e)) from e
+    return _score_features(features, content_hash)
+
+
+def classify_pcm_sync(pcm, sample_rate, channels, sample_format, content_hash=None):
+    """Worker-thread job for /classify/raw: PCM samples straight into feature extraction."""
+    try:
+        features = make_model_input_from_pcm(pcm, sample_rate, channels, sample_format)
+    except Exception as e:
+        raise AudioPreprocessError(str(e)) from e
+    return _score_features(features, content_hash)
+
+
+def classify_features_sync(blob, content_hash):
+    """Worker-thread job for /classify/features; FeatureFormatError propagates (422)."""
+    return _score_features(decode_features(blob), content_hash)
+
+
+def classify_batch_sync(audio_sources, content_hashes):
+    """
+    Worker-thread job for /classify/batch: preprocess every file, then score
+    them all with one matrix product. Returns one result dict per file, or an
+    AudioPreprocessError instance for files that couldn't be decoded.
+    """
+    outcomes = [None] * len(audio_sources)
+    features = []
+    for i, source in enumerate(audio_sources):
+        try:
+            features.append((i, make_model_input(source)))
+        except Exception as e:
+            outcomes[i] = AudioPreprocessError(str(e))
+    t0 = time.perf_counter()
+    try:
+        outs = run_emotion_model_batch([f for _, f in features], [content_hashes[i] for i, _ in features])
+    except Exception:
+        outs = [{"state": "Unknown", "accuracy": 0.0}] * len(features)
+    # the product is shared, so each file is charged an equal part of it
+    share = (time.perf_counter() - t0) / max(1, len(features))
+    dt = round(share, 4)
+    for (i, feat), out in zip(features, outs):
+        observe_stage("scoring", share)
+        result = {"state": out.get("state", "Unknown"), "accuracy": out.get("accuracy", 0.0), "inference_time": dt}
+        if FEATURE_STORE_ENABLED and result["state"] != "Unknown":
+            result["feature_blob"] = encode_vector(compact_features(feat))
+        outcomes[i] = result
+    return outcomes
+
+
+def classify_window_sync(snapshot):
+    """Worker-thread job for /ws/stream: finish the window's features and run the model."""
+    return call_teammate_sync(window_features(snapshot))
+
+
+def _score_features(features, content_hash):
+    result = call_teammate_sync(features, content_hash)
+    if FEATURE_STORE_ENABLED and result["state"] != "Unknown":
+        # kept with the cached result, so repeat uploads log their vector too
+        result["feature_blob"] = encode_vector(compact_features(features))
+    return result
+
+
+def call_teammate_sync(features, jitter_key=None):
     """
     Synchronous wrapper that calls the teammate function.
     Any heavy CPU/GPU code inside run_emotion_model runs here.
@@ -99,11 +694,13 @@ def call_teammate_sync(features):
     """
     t0 = time.perf_counter()
     try:
-        out = run_emotion_model(features)
+        out = run_emotion_model(features, jitter_key=jitter_key)
     except Exception as e:
         # If teammate's function crashes, return a safe default
         return {"state": "Unknown", "accuracy": 0.0, "inference_time": 0.0}
-    dt = round(time.perf_counter() - t0, 4)
+    elapsed = time.perf_counter() - t0
+    observe_stage("scoring", elapsed)
+    dt = round(elapsed, 4)
     # Ensure returned object has expected fields
     return {
         "state": out.get("state", "Unknown"),
@@ -111,15 +708,306 @@ def call_teammate_sync(features):
         "inference_time": dt
     }
 
+STREAM_HOP_MS = int(os.environ.get("MAITRI_STREAM_HOP_MS", "500"))
+STREAM_MIN_HOP_MS = 100
+STREAM_MAX_MESSAGE_BYTES = 1024 * 1024
+# audio per message; bounds the frames a single push() has to compute
+STREAM_MAX_MESSAGE_S = 5
+
+
+@app.websocket("/ws/stream")
+async def stream_classify(
+    websocket: WebSocket,
+    sample_rate: int = TARGET_SR,
+    channels: int = 1,
+    format: str = "s16le",
+    hop_ms: int = STREAM_HOP_MS,
+):
+    """
+    Continuous classification of a live recording.
+    The client sends binary messages of interleaved little-endian PCM
+    (format s16le or f32le, any sample rate / channel count given in the
+    query string). Every `hop_ms` of audio the server classifies the latest
+    4-second window and sends
+      {"type": "classification", "emotion", "confidence", "window_end_s", "latency_ms", "dropped_windows"}
+    At most one window per connection is being scored; when the client
+    outpaces the model, a newer window replaces the waiting one and windows
+    that can't start within one hop are dropped, so results never lag behind.
+    Stream windows overlap and are not logged to the database. A message
+    may carry at most STREAM_MAX_MESSAGE_S seconds of audio (and 1 MiB).
+    """
+    await websocket.accept()
+    if format not in PCM_FORMATS or not PCM_MIN_SAMPLE_RATE <= sample_rate <= PCM_MAX_SAMPLE_RATE or channels < 1:
+        await websocket.send_json({
+            "type": "error",
+            "detail": f"Invalid sample_rate, channels or format (sample_rate {PCM_MIN_SAMPLE_RATE}-{PCM_MAX_SAMPLE_RATE})",
+        })
+        await websocket.close(code=1003)
+        return
+    features = StreamingFeatures(sample_rate, channels, format)
+    frame_bytes = PCM_FORMATS[format].itemsize * channels
+    max_message_bytes = min(STREAM_MAX_MESSAGE_BYTES, STREAM_MAX_MESSAGE_S * sample_rate * frame_bytes)
+    # windows end on STFT frame boundaries so full windows reuse the incremental frames exactly
+    hop_samples = max(1, round(max(hop_ms, STREAM_MIN_HOP_MS) * TARGET_SR / 1000 / HOP_LENGTH)) * HOP_LENGTH
+    hop_s = hop_samples / TARGET_SR
+    latest = None           # (window_end_samples, snapshot) waiting to be scored
+    ready = asyncio.Event()
+    dropped = 0
+
+    async def scorer():
+        nonlocal latest, dropped
+        while True:
+            await ready.wait()
+            ready.clear()
+            window_end, snap = latest
+            latest = None
+            t0 = time.perf_counter()
+            try:
+                # not started within a hop -> a fresher window is already on its way
+                result = await scheduler.submit(
+                    classify_window_sync, snap, priority="interactive", deadline=time.monotonic() + hop_s,
+                )
+            except DeadlineExceeded:
+                dropped += 1
+                continue
+            await websocket.send_json({
+                "type": "classification",
+                "emotion": result.get("state", "Unknown"),
+                "confidence": result.get("accuracy", 0.0),
+                "window_end_s": round(window_end / TARGET_SR, 3),
+                "latency_ms": round((time.perf_counter() - t0) * 1000, 1),
+                "dropped_windows": dropped,
+            })
+
+    scoring = asyncio.create_task(scorer())
+    next_window = hop_samples
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            chunk = message.get("bytes")
+            if not chunk:
+                continue
+            if len(chunk) > max_message_bytes:
+                await websocket.close(code=1009)
+                break
+            # resampling and the new frames' FFTs run on a worker; snapshot() stays on the loop
+            if await scheduler.submit(features.push, chunk, priority="interactive") < next_window:
+                continue
+            # skip every hop boundary the chunk jumped over; only the newest window matters
+            while next_window <= features.samples:
+                next_window += hop_samples
+            if latest is not None:
+                dropped += 1
+            latest = (features.samples, features.snapshot())
+            ready.set()
+            if scoring.done():
+                # the scorer only stops on a send failure, i.e. the client is gone
+                break
+    finally:
+        scoring.cancel()
+        try:
+            await scoring
+        except BaseException:
+            pass
+
+
+HISTORY_DEFAULT_LIMIT = 500
+HISTORY_MAX_LIMIT = 5000
+
+
 @app.get("/history")
-async def history(hours: int = 48):
+async def history(
+    hours: int = 48,
+    limit: int = HISTORY_DEFAULT_LIMIT,
+    cursor: Optional[str] = None,
+    state: Optional[str] = None,
+    accept: Optional[str] = Header(None),
+):
+    """
+    Optional helper to fetch recent logs from SQLite, newest first.
+    Paginated: at most `limit` rows per call; pass the returned `next_cursor`
+    back as `cursor` for the next page (null when there are no more rows).
+    `state` restricts the results to one emotion.
+    JSON by default, MessagePack with `Accept: application/msgpack`.
+    """
+    if limit < 1 or limit > HISTORY_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {HISTORY_MAX_LIMIT}")
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    # one extra row tells us whether another page exists; recent windows come from memory
+    rows = recent.query(int(time.time()) - hours * 3600, limit + 1, cursor=after, state=state)
+    if rows is None:
+        rows = await get_history(hours, limit=limit + 1, cursor=after, state=state)
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return encoded_response({"history": Rows(LOG_COLUMNS, rows[:limit]), "next_cursor": next_cursor}, accept)
+
+
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 500
+
+
+@app.get("/history/search")
+async def history_search(
+    q: str,
+    hours: Optional[int] = None,
+    state: Optional[str] = None,
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    offset: int = 0,
+    accept: Optional[str] = Header(None),
+):
+    """
+    Full-text search over logged user messages, best match first (BM25).
+    Every word in `q` must appear (a trailing * matches prefixes); `hours`
+    and `state` narrow the results. Pass the returned `next_offset` back as
+    `offset` for the next page (null when there are no more matches).
+    JSON by default, MessagePack with `Accept: application/msgpack`.
+    """
+    if limit < 1 or limit > SEARCH_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {SEARCH_MAX_LIMIT}")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="offset must be >= 0")
+    match = fts_query(q)
+    if match is None:
+        raise HTTPException(status_code=400, detail="q must contain at least one word")
+    rows = await search_logs(match, hours=hours, state=state, limit=limit + 1, offset=offset)
+    if rows is None:
+        raise HTTPException(status_code=503, detail="Full-text search is not available on this server")
+    # bm25() is lower-is-better; flip it so clients can read it as a relevance score
+    results = [row[:6] + (round(-row[6], 4), row[7]) for row in rows[:limit]]
+    next_offset = offset + limit if len(rows) > limit else None
+    return encoded_response(
+        {"results": Rows(LOG_COLUMNS + ("score", "snippet"), results), "next_offset": next_offset},
+        accept,
+    )
+
+
+@app.get("/history/summary")
+async def history_summary(hours: int = 24, interval: Optional[str] = None):
+    """
+    Dashboard aggregates per time bucket, answered from the rollup tables:
+    counts per emotion, average accuracy and average / p50 / p95 inference time.
+    `interval` is "minute" or "hour" (default: minute up to 6 hours, hour beyond).
+    """
+    interval = interval or ("minute" if hours <= 6 else "hour")
+    if interval not in ROLLUP_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {sorted(ROLLUP_INTERVALS)}")
+    end_ts = int(time.time()) + 1
+    buckets = await get_rollup_summary(interval, end_ts - hours * 3600, end_ts)
+    return {"interval": interval, "bucket_seconds": ROLLUP_INTERVALS[interval], "buckets": buckets}
+
+
+EXPORT_CHUNK_ROWS = 1000
+# typed columns convert a whole chunk at once, so bigger chunks pay off
+COLUMNAR_CHUNK_ROWS = 10000
+
+
+@app.get("/history/export")
+async def history_export(
+    hours: int = 24,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    state: Optional[str] = None,
+    format: str = "ndjson",
+    gzip: bool = False,
+):
+    """
+    Stream a time range of logs, oldest first, as NDJSON (one object per line)
+    or CSV. The range is [start, end) in epoch seconds, or the last `hours`
+    when start is omitted. Rows are read and written in chunks, so server memory
+    stays constant however large the range. gzip=true compresses the transfer.
+    For analytics, format=npz returns typed NumPy columns (and format=arrow an
+    Arrow IPC stream when pyarrow is installed); see services/history_export.py.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(EXPORT_FORMATS)}")
+    end_ts = end if end is not None else int(time.time()) + 1
+    start_ts = start if start is not None else end_ts - hours * 3600
+    chunk_rows = COLUMNAR_CHUNK_ROWS if format in COLUMNAR_FORMATS else EXPORT_CHUNK_ROWS
+    rows = iter_history_range(start_ts, end_ts, state=state, chunk_rows=chunk_rows)
+    body = export_body(rows, LOG_COLUMNS, fmt=format, compress=gzip)
+    headers = {"Content-Disposition": f'attachment; filename="maitri_history_{start_ts}_{end_ts}.{format}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=EXPORT_FORMATS[format], headers=headers)
+
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """
+    Per-priority-class queue depth, drops and wait/latency percentiles,
+    plus how many requests were coalesced onto an identical in-flight one,
+    result cache / recent-history buffer hit rates, the DB log queue/batch
+    counters and retention runs.
+    """
+    stats = scheduler.stats()
+    stats["coalescing"] = inflight.stats()
+    stats["result_cache"] = result_cache.stats()
+    stats["log_writer"] = log_writer.stats()
+    stats["retention"] = retention.stats()
+    stats["recent_buffer"] = recent.stats()
+    stats["rescore"] = rescore.stats()
+    return stats
+
+
+@app.post("/admin/rescore", status_code=202)
+async def start_rescore():
+    """
+    Re-score every stored feature vector against the current model in the
+    background (needs MAITRI_FEATURE_STORE=1 while logging). Poll GET for progress.
+    """
+    if not rescore.start():
+        raise HTTPException(status_code=409, detail="A re-score run is already in progress")
+    return {"status": "started", "model_version": model_version()}
+
+
+@app.get("/admin/rescore")
+async def rescore_status():
+    """Progress / result of the latest re-score: processed, changed and per-transition counts."""
+    return rescore.stats()
+
+
+@app.get("/metrics")
+async def metrics():
     """
-    Optional helper to fetch recent logs from SQLite.
+    Prometheus text format: request counts / latency per handler, per-stage
+    latency histograms (upload read, decode, resample, features, scoring, DB
+    logging), scheduler queue depth and active workers, cache hit rates,
+    log queue depth and process RSS.
     """
-    rows = await get_history(hours)
-    keys = ["id","state","accuracy","user_message","inference_time","timestamp"]
-    results = [dict(zip(keys,row)) for row in rows]
-    return {"history": results}
+    sched = scheduler.stats()
+    caches = {"result": result_cache.stats(), "recent_history": recent.stats()}
+    coalescing = inflight.stats()
+    writer = log_writer.stats()
+    lines = []
+    lines += gauge_lines("maitri_scheduler_queue_depth", "Jobs waiting for an inference worker.",
+                         [({"priority": name}, c["queued"]) for name, c in sched["classes"].items()])
+    lines += gauge_lines("maitri_scheduler_active_workers", "Inference jobs currently running.", [({}, sched["active"])])
+    lines += gauge_lines("maitri_scheduler_workers", "Inference worker threads.", [({}, sched["workers"])])
+    lines += gauge_lines("maitri_scheduler_dropped_total", "Jobs dropped because their deadline passed.",
+                         [({"priority": name}, c["dropped"]) for name, c in sched["classes"].items()], kind="counter")
+    lines += gauge_lines("maitri_cache_hits_total", "Cache lookups answered from memory.",
+                         [({"cache": name}, c["hits"]) for name, c in caches.items()], kind="counter")
+    lines += gauge_lines("maitri_cache_misses_total", "Cache lookups that fell through.",
+                         [({"cache": name}, c["misses"]) for name, c in caches.items()], kind="counter")
+    lines += gauge_lines("maitri_cache_hit_ratio", "Hit rate since start.",
+                         [({"cache": name}, c["hit_rate"]) for name, c in caches.items()])
+    lines += gauge_lines("maitri_coalesced_requests_total", "Requests that joined an identical in-flight computation.",
+                         [({}, coalescing["coalesced"])], kind="counter")
+    lines += gauge_lines("maitri_log_queue_depth", "Log rows waiting for the DB writer.", [({}, writer["queue_depth"])])
+    lines += gauge_lines("maitri_log_rows_dropped_total", "Log rows dropped (queue full or shutdown).",
+                         [({}, writer["dropped"])], kind="counter")
+    limits = rate_limits.stats()
+    lines += gauge_lines("maitri_rate_limited_total", "Requests refused with 429 by the per-client rate limit.",
+                         [({}, limits["limited"])], kind="counter")
+    lines += gauge_lines("maitri_rate_limit_clients", "Clients with a live token bucket.", [({}, limits["clients"])])
+    lines += gauge_lines("process_resident_memory_bytes", "Resident memory size in bytes.", [({}, process_rss_bytes())])
+    return PlainTextResponse(render_metrics(lines), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/health")
@@ -1,5 +1,7 @@
 # models/model_function.py
 import os
+import hashlib
+import threading
 import numpy as np
 import json
 
@@ -8,23 +10,51 @@ _checkpoint = None
 _signatures = None
 _emotion_labels = None
 _model_loaded = False
+_model_version = None
+_sig_matrix = None
 
-def _cosine_similarity(a, b):
-    """Compute cosine similarity between two vectors (numpy-only)."""
-    norm_a = np.linalg.norm(a)
-    norm_b = np.linalg.norm(b)
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
-    return float(np.dot(a, b) / (norm_a * norm_b))
+# Confidence jitter mode (MAITRI_JITTER):
+#   "random" - fresh jitter every call (default, the original behaviour)
+#   "hash"   - jitter derived from the input, so identical audio always gives identical output
+#   "off"    - no jitter at all
+# "hash" and "off" make results safe to memoize, HTTP-cache and regression-test.
+JITTER_MODE = os.environ.get("MAITRI_JITTER", "random").strip().lower()
+JITTER_RANGE = 0.05
+
+# what the model returns when it can't score an input; callers don't cache or log it
+UNKNOWN_RESULT = {"state": "Unknown", "accuracy": 0.0}
+
+# one generator per executor thread instead of the global, lock-protected NumPy RNG
+_thread_state = threading.local()
+
+# executor threads can ask for the model at the same time on a cold process
+_load_lock = threading.Lock()
+
+def _signature_matrix():
+    """(n_emotions, sig_dim) matrix of unit-norm signatures, in _emotion_labels order."""
+    global _sig_matrix
+    if _sig_matrix is None:
+        S = np.stack([_signatures[e] for e in _emotion_labels]).astype(np.float32)
+        norms = np.linalg.norm(S, axis=1, keepdims=True)
+        # an all-zero signature keeps similarity 0.0 with everything
+        _sig_matrix = np.divide(S, norms, out=np.zeros_like(S), where=norms > 0)
+    return _sig_matrix
 
 def _load_emotion_signatures():
-    """Try to load emotion signatures in order of preference."""
-    global _signatures, _emotion_labels, _model_loaded
-    
+    """Load the signatures once; other threads wait until they are complete."""
+    global _model_loaded, _model_version
     if _model_loaded:
         return
-    
-    _model_loaded = True
+    with _load_lock:
+        if not _model_loaded:
+            _read_emotion_signatures()
+            _model_version = _fingerprint()
+            # set last, so the unlocked check above never sees a half-loaded model
+            _model_loaded = True
+
+def _read_emotion_signatures():
+    """Try to load emotion signatures in order of preference."""
+    global _signatures, _emotion_labels
     
     # 1. Try to load from extracted signatures JSON (created by extract_model.py)
     sig_json_path = os.path.join(os.path.dirname(__file__), "..", "..", "model_extracted", "model_signatures.json")
@@ -63,12 +93,13 @@ def _load_emotion_signatures():
     # 3. Use hardcoded emotions and synthetic signatures
     # These are placeholder values to ensure system works without model file
     print(f"[INFO] Using synthetic emotion signatures (model file not available)")
-    np.random.seed(42)
+    # local RandomState(42) draws the same values as np.random.seed(42) without touching global state
+    rs = np.random.RandomState(42)
     emotions = ["Neutral", "Happy", "Sad", "Anger", "Disgust"]
     signature_size = 2048  # ResNet50 embedding size (matches typical audio features)
     _signatures = {}
     for i, emotion in enumerate(emotions):
-        sig = np.random.randn(signature_size).astype(np.float32) * 0.5
+        sig = rs.randn(signature_size).astype(np.float32) * 0.5
         sig += i * 0.15
         sig = sig / (np.linalg.norm(sig) + 1e-8)
         _signatures[emotion] = sig
@@ -80,88 +111,179 @@ def _load_hybrid_model():
     _load_emotion_signatures()
 
 
-def run_emotion_model(features):
+def emotion_labels():
+    """Emotion names in the column order of score_feature_matrix."""
+    _load_hybrid_model()
+    return list(_emotion_labels)
+
+
+def signature_dim():
+    """Length of the compact feature vector the signatures are compared against."""
+    _load_hybrid_model()
+    return len(next(iter(_signatures.values())))
+
+
+def compact_features(features):
+    """
+    Flatten audio_service features (1, 1, n_mels, T) and pad / downsample them
+    to the signature dimension. Returns a (sig_dim,) float32 vector - the
+    compact form the classifier actually scores, and what the feature store keeps.
+    """
+    _load_hybrid_model()
+    if isinstance(features, np.ndarray):
+        # Flatten the (1, 1, n_mels, T) to (n_mels*T,)
+        features_flat = features.reshape(-1).astype(np.float32)
+    else:
+        features_flat = np.array(features, dtype=np.float32).reshape(-1)
+    
+    sig_dim = signature_dim()
+    feat_dim = len(features_flat)
+    
+    # If dimensions don't match, resize features using interpolation or padding
+    if feat_dim != sig_dim:
+        if feat_dim < sig_dim:
+            # Pad with zeros if features are too small
+            features_flat = np.pad(features_flat, (0, sig_dim - feat_dim), mode='constant')
+        else:
+            # Downsample by averaging if features are too large
+            factor = feat_dim / sig_dim
+            indices = (np.arange(sig_dim) * factor).astype(int)
+            indices = np.clip(indices, 0, feat_dim - 1)
+            features_flat = features_flat[indices]
+    return features_flat
+
+
+def score_feature_matrix(X):
+    """
+    Cosine similarity of every row of X (n, sig_dim) to every emotion signature,
+    as a single matrix product. Returns (n, n_emotions).
+    """
+    _load_hybrid_model()
+    X = np.asarray(X, dtype=np.float32)
+    X_norm = X / (np.linalg.norm(X, axis=1, keepdims=True) + 1e-8)
+    return X_norm @ _signature_matrix().T
+
+
+def _fingerprint():
+    h = hashlib.sha256()
+    for emotion in _emotion_labels:
+        h.update(emotion.encode("utf-8"))
+        h.update(np.ascontiguousarray(_signatures[emotion]).tobytes())
+    return h.hexdigest()[:12]
+
+
+def model_version():
+    """Short fingerprint of the loaded signatures; changes whenever the model does."""
+    # computed by the locked load, never from a half-loaded model
+    _load_hybrid_model()
+    return _model_version
+
+
+def is_deterministic():
+    """True when the same input always produces the same output."""
+    return JITTER_MODE in ("hash", "off")
+
+
+def _jitter(features_flat, jitter_key=None):
+    """Confidence offset in [-JITTER_RANGE, JITTER_RANGE] according to JITTER_MODE."""
+    if JITTER_MODE == "off":
+        return 0.0
+    if JITTER_MODE == "hash":
+        # seed from the caller's content hash when given, else from the features themselves
+        seed_material = jitter_key.encode("utf-8") if isinstance(jitter_key, str) else jitter_key
+        if seed_material is None:
+            seed_material = features_flat.tobytes()
+        seed = int.from_bytes(hashlib.blake2b(seed_material, digest_size=8).digest(), "little")
+        return float(np.random.default_rng(seed).uniform(-JITTER_RANGE, JITTER_RANGE))
+    rng = getattr(_thread_state, "rng", None)
+    if rng is None:
+        rng = _thread_state.rng = np.random.default_rng()
+    return float(rng.uniform(-JITTER_RANGE, JITTER_RANGE))
+
+
+def _result_from_scores(sims, features_flat, jitter_key=None):
+    """Emotion + confidence from one row of score_feature_matrix output."""
+    # Find emotion with highest similarity
+    emotion_idx = np.argmax(sims)
+    emotion_name = _emotion_labels[emotion_idx]
+    
+    # Compute confidence scores with randomness (86-97% range)
+    sims_array = sims.astype(np.float32)
+    best_sim = sims_array[emotion_idx]
+    second_best_sim = np.max(sims_array[np.arange(len(sims_array)) != emotion_idx])
+    
+    # Margin between best and second best
+    margin = best_sim - second_best_sim
+    margin_normalized = (margin + 1.0) / 2.0  # Map [-1, 1] to [0, 1]
+    
+    # Base confidence with margin influence
+    base_confidence = 0.87 + (margin_normalized - 0.5) * 0.15
+    
+    # Add natural variation: offset in ±5% range around base (see JITTER_MODE)
+    random_offset = _jitter(features_flat, jitter_key)
+    confidence = base_confidence + random_offset
+    
+    # Clamp strictly to target range [0.86 to 0.97]
+    confidence = np.clip(confidence, 0.86, 0.97)
+    
+    return {
+        "state": emotion_name,
+        "accuracy": round(float(confidence), 2)
+    }
+
+
+def run_emotion_model(features, jitter_key=None):
     """
     Real hybrid emotion classifier using pre-trained model signatures.
     - Input: 'features' numpy array shape (1, 1, n_mels, T) from audio_service
-    - Output: dict {"state": "<EmotionName>", "accuracy": <confidence>}
+      'jitter_key' optional bytes/str (e.g. the audio content hash) used to seed
+      the confidence jitter when MAITRI_JITTER=hash
+    - Output: dict {"state": "<EmotionName>", "accuracy": <confidence>}, or
+      {"state": "Unknown", "accuracy": 0.0} if the model could not score it
+      (never cached or logged as a classification)
     """
     try:
         _load_hybrid_model()
         
-        # features should be shape (1, 1, n_mels, T) from audio_service.make_model_input
-        # Flatten to 1D for the hybrid classifier
-        if isinstance(features, np.ndarray):
-            # Flatten the (1, 1, n_mels, T) to (n_mels*T,)
-            features_flat = features.reshape(-1).astype(np.float32)
-        else:
-            features_flat = np.array(features, dtype=np.float32).reshape(-1)
-        
         # Ensure signatures are loaded
         if _signatures is None or len(_emotion_labels) == 0:
             print("[ERROR] Failed to load emotion signatures")
-            return {"state": "Calm", "accuracy": 0.5}
-        
-        # Get the feature dimension from the first signature
-        first_sig = next(iter(_signatures.values()))
-        sig_dim = len(first_sig)
-        feat_dim = len(features_flat)
-        
-        # If dimensions don't match, resize features using interpolation or padding
-        if feat_dim != sig_dim:
-            if feat_dim < sig_dim:
-                # Pad with zeros if features are too small
-                features_flat = np.pad(features_flat, (0, sig_dim - feat_dim), mode='constant')
-            else:
-                # Downsample by averaging if features are too large
-                factor = feat_dim / sig_dim
-                indices = (np.arange(sig_dim) * factor).astype(int)
-                indices = np.clip(indices, 0, feat_dim - 1)
-                features_flat = features_flat[indices]
-        
-        # Normalize input features
-        features_norm = features_flat / (np.linalg.norm(features_flat) + 1e-8)
-        
-        # Compute similarity scores to emotion signatures
-        sims = []
-        for emotion in _emotion_labels:
-            sig = _signatures[emotion]
-            # Cosine similarity between normalized features and signature
-            sim = _cosine_similarity(features_norm, sig)
-            sims.append(sim)
+            return dict(UNKNOWN_RESULT)
         
-        # Find emotion with highest similarity
-        emotion_idx = np.argmax(sims)
-        emotion_name = _emotion_labels[emotion_idx]
+        # Flatten and resize to the signature dimension
+        features_flat = compact_features(features)
         
-        # Compute confidence scores with randomness (86-97% range)
-        sims_array = np.array(sims, dtype=np.float32)
-        best_sim = sims_array[emotion_idx]
-        second_best_sim = np.max(sims_array[np.arange(len(sims_array)) != emotion_idx])
-        
-        # Margin between best and second best
-        margin = best_sim - second_best_sim
-        margin_normalized = (margin + 1.0) / 2.0  # Map [-1, 1] to [0, 1]
-        
-        # Base confidence with margin influence
-        base_confidence = 0.87 + (margin_normalized - 0.5) * 0.15
-        
-        # Add randomness for natural variation each time
-        # Random offset in ±5% range around base
-        random_offset = np.random.uniform(-0.05, 0.05)
-        confidence = base_confidence + random_offset
-        
-        # Clamp strictly to target range [0.86 to 0.97]
-        confidence = np.clip(confidence, 0.86, 0.97)
-        
-        return {
-            "state": emotion_name,
-            "accuracy": round(float(confidence), 2)
-        }
+        # Cosine similarity to every emotion signature in one product
+        sims = score_feature_matrix(features_flat[np.newaxis, :])[0]
+        return _result_from_scores(sims, features_flat, jitter_key)
     
     except Exception as e:
         print(f"[ERROR] Model inference failed: {e}")
         import traceback
         traceback.print_exc()
-        # Fallback to safe value
-        return {"state": "Neutral", "accuracy": 0.5}
+        return dict(UNKNOWN_RESULT)
+
+
+def run_emotion_model_batch(features_list, jitter_keys=None):
+    """
+    run_emotion_model for many inputs at once: all of them are scored with a
+    single matrix product. Returns one result dict per input, in order; the
+    scores agree with run_emotion_model's up to float rounding.
+    """
+    if jitter_keys is None:
+        jitter_keys = [None] * len(features_list)
+    try:
+        _load_hybrid_model()
+        if _signatures is None or len(_emotion_labels) == 0:
+            print("[ERROR] Failed to load emotion signatures")
+            return [dict(UNKNOWN_RESULT) for _ in features_list]
+        if not features_list:
+            return []
+        X = np.stack([compact_features(f) for f in features_list])
+        scores = score_feature_matrix(X)
+        return [_result_from_scores(scores[i], X[i], key) for i, key in enumerate(jitter_keys)]
+    except Exception as e:
+        print(f"[ERROR] Batch model inference failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return [dict(UNKNOWN_RESULT) for _ in features_list]
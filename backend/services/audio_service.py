@@ -10,24 +10,72 @@ import io
 import numpy as np
 import soundfile as sf
 
+from .metrics import timed
+
 TARGET_SR = 16000    # sampling rate for model
 DURATION = 4.0       # seconds; backend pads/truncates to this length
 N_MELS = 64          # mel bins for log-mel
+N_FFT = 512          # STFT frame length (samples)
+HOP_LENGTH = 256     # STFT hop (samples)
+# bump whenever extract_log_mel's output changes, so clients sending
+# precomputed features (/classify/features) are refused instead of misread
+FEATURE_VERSION = 1
+
+# little-endian PCM sample formats accepted by /classify/raw
+PCM_FORMATS = {
+    "s16le": np.dtype("<i2"),
+    "f32le": np.dtype("<f4"),
+}
+
+def read_audio_bytes(audio_bytes, sr: int = TARGET_SR, max_duration: float = DURATION):
+    # Read with soundfile (handles wav, flac, etc.). Besides raw bytes this accepts
+    # an open binary file (e.g. the spooled upload) so it is decoded in place.
+    source = io.BytesIO(audio_bytes) if isinstance(audio_bytes, (bytes, bytearray, memoryview)) else audio_bytes
+    with timed("decode"):
+        data, orig_sr = sf.read(source, dtype='float32')
+    return fit_waveform(data, orig_sr, sr, max_duration)
+
+def read_pcm(pcm, sample_rate: int, channels: int = 1, sample_format: str = "s16le",
+             sr: int = TARGET_SR, max_duration: float = DURATION):
+    """
+    Interleaved little-endian PCM (bytes-like) -> the same fixed-length float32
+    waveform read_audio_bytes gives for a WAV holding those samples.
+    The buffer is viewed in place, with no container or decoder involved.
+    Only the first `max_duration` seconds are converted and resampled.
+    """
+    dtype = PCM_FORMATS.get(sample_format)
+    if dtype is None:
+        raise ValueError(f"Unsupported sample format '{sample_format}', expected one of {sorted(PCM_FORMATS)}")
+    frame_bytes = dtype.itemsize * channels
+    if len(pcm) == 0 or len(pcm) % frame_bytes:
+        raise ValueError(f"PCM body must be a non-empty whole number of {frame_bytes}-byte frames")
+    # everything past max_duration is trimmed anyway; don't resample it first
+    max_frames = int(np.ceil(sample_rate * max_duration))
+    with timed("decode"):
+        data = np.frombuffer(pcm, dtype=dtype, count=min(len(pcm) // frame_bytes, max_frames) * channels)
+        if dtype.kind == "i":
+            # same scaling libsndfile applies when reading 16-bit PCM as float
+            data = data.astype(np.float32) * np.float32(1.0 / 32768)
+        else:
+            data = data.astype(np.float32, copy=False)
+        if channels > 1:
+            data = data.reshape(-1, channels)
+    return fit_waveform(data, sample_rate, sr, max_duration)
 
-def read_audio_bytes(audio_bytes: bytes, sr: int = TARGET_SR, max_duration: float = DURATION):
-    # Read with soundfile (handles wav, flac, etc.)
-    data, orig_sr = sf.read(io.BytesIO(audio_bytes), dtype='float32')
+def fit_waveform(data: np.ndarray, orig_sr: int, sr: int = TARGET_SR, max_duration: float = DURATION):
+    """Mono-mix, resample to `sr` and trim / zero-pad to `max_duration` seconds."""
     # make mono if needed
     if data.ndim > 1:
         data = data.mean(axis=1)
     # resample to target sr (lightweight numpy-based resampling)
     if orig_sr != sr:
-        # simple linear interpolation resample to avoid heavy external deps
-        resample_factor = float(sr) / float(orig_sr)
-        new_len = int(np.ceil(len(data) * resample_factor))
-        old_idx = np.arange(len(data))
-        new_idx = np.linspace(0, len(data) - 1, new_len)
-        data = np.interp(new_idx, old_idx, data).astype('float32')
+        with timed("resample"):
+            # simple linear interpolation resample to avoid heavy external deps
+            resample_factor = float(sr) / float(orig_sr)
+            new_len = int(np.ceil(len(data) * resample_factor))
+            old_idx = np.arange(len(data))
+            new_idx = np.linspace(0, len(data) - 1, new_len)
+            data = np.interp(new_idx, old_idx, data).astype('float32')
     # trim or pad to max_duration
     max_len = int(sr * max_duration)
     if len(data) > max_len:
@@ -38,49 +86,50 @@ def read_audio_bytes(audio_bytes: bytes, sr: int = TARGET_SR, max_duration: floa
 
 def extract_log_mel(audio: np.ndarray, sr: int = TARGET_SR, n_mels: int = N_MELS):
     # Lightweight spectrogram-based features without librosa.
-    # Compute short-time Fourier magnitude spectrogram
-    n_fft = 512
-    hop_length = 256
-    # number of frames
-    frames = 1 + (len(audio) - n_fft) // hop_length if len(audio) >= n_fft else 1
     # pad if needed
-    if len(audio) < n_fft:
-        audio = np.pad(audio, (0, n_fft - len(audio)), mode='constant')
-
-    # build frames and compute positive-frequency FFT magnitude directly
-    pos_freq_bins = (n_fft // 2) + 1
-    S = np.empty((pos_freq_bins, frames), dtype=np.float32)
-    for i in range(frames):
-        start = i * hop_length
-        frame = audio[start:start + n_fft]
-        if len(frame) < n_fft:
-            frame = np.pad(frame, (0, n_fft - len(frame)), mode='constant')
-        windowed = frame * np.hanning(len(frame))
-        spec = np.fft.rfft(windowed)
-        S[:, i] = np.abs(spec).astype(np.float32)
+    if len(audio) < N_FFT:
+        audio = np.pad(audio, (0, N_FFT - len(audio)), mode='constant')
+    # every full N_FFT frame starting on a HOP_LENGTH boundary, as a strided view
+    frames = np.lib.stride_tricks.sliding_window_view(audio, N_FFT)[::HOP_LENGTH]
+    return log_mel_from_bands(mel_bands(frames, n_mels))
 
+def mel_bands(frames: np.ndarray, n_mels: int = N_MELS):
+    """
+    (n_frames, N_FFT) audio frames -> (n_mels, n_frames) float32 band magnitudes:
+    Hann-windowed FFT magnitude, contiguous bins averaged into n_mels bands.
+    Frames are independent, so streams can compute them incrementally.
+    """
+    # positive-frequency FFT magnitude of every frame at once
+    S = np.abs(np.fft.rfft(frames * np.hanning(frames.shape[1]), axis=1)).astype(np.float32)
     # reduce frequency bins to n_mels by averaging contiguous bins
-    freq_bins = S.shape[0]
-    bins_per_mel = max(1, freq_bins // n_mels)
-    mel_S = np.zeros((n_mels, S.shape[1]), dtype=np.float32)
-    for m in range(n_mels):
-        start_bin = m * bins_per_mel
-        end_bin = start_bin + bins_per_mel
-        mel_S[m, :] = S[start_bin:end_bin, :].mean(axis=0)
+    bins_per_mel = max(1, S.shape[1] // n_mels)
+    bands = S[:, :n_mels * bins_per_mel].reshape(len(S), n_mels, bins_per_mel).mean(axis=2)
+    return np.ascontiguousarray(bands.T)
 
+def log_mel_from_bands(mel_S: np.ndarray):
+    """dB scale + per-clip standardization of mel_bands output."""
     # convert to dB-like scale
     log_S = 20.0 * np.log10(np.maximum(mel_S, 1e-10))
     # standardize
     log_S = (log_S - log_S.mean()) / (log_S.std() + 1e-6)
     return log_S.astype('float32')
 
-def make_model_input(audio_bytes: bytes):
+def make_model_input(audio_bytes):
     """
     Final output is 'features' passed to teammate function.
+    'audio_bytes' may be raw bytes or a seekable binary file object.
     Current shape: (1, 1, n_mels, T)  -- batch + channel + mel + time
     Teammate should expect this format or we can change it to match them.
     """
     audio = read_audio_bytes(audio_bytes)
-    feat = extract_log_mel(audio)
+    with timed("features"):
+        feat = extract_log_mel(audio)
     # add batch & channel dims: (1,1,n_mels,T)
     return feat[np.newaxis, np.newaxis, :, :]
+
+def make_model_input_from_pcm(pcm, sample_rate: int, channels: int = 1, sample_format: str = "s16le"):
+    """make_model_input for raw PCM bodies (see read_pcm); same (1, 1, n_mels, T) output."""
+    audio = read_pcm(pcm, sample_rate, channels, sample_format)
+    with timed("features"):
+        feat = extract_log_mel(audio)
+    return feat[np.newaxis, np.newaxis, :, :]
@@ -0,0 +1,53 @@
+# services/drain.py
+"""
+Refuse new work once shutdown has started.
+
+uvicorn stops accepting connections and waits for in-flight requests
+before the app's shutdown handler runs; that handler then drains the
+scheduler and the log writer. Anything that still reaches the app after
+DrainMiddleware.draining is set gets a fast 503 (Retry-After, Connection:
+close) or a 1012 "service restart" WebSocket close instead of queueing
+work that would be cut off, so clients retry against another worker.
+"""
+import asyncio
+
+from starlette.responses import JSONResponse
+
+# Retry-After for requests refused while draining, in seconds
+DRAIN_RETRY_AFTER_S = 1
+
+
+class DrainState:
+    def __init__(self):
+        self.draining = False
+        # requests cancelled mid-flight (uvicorn's graceful timeout ran out, or forced exit)
+        self.requests_aborted = 0
+
+
+class DrainMiddleware:
+    """Pure ASGI middleware refusing requests once `state.draining` is set."""
+
+    def __init__(self, app, state):
+        self.app = app
+        self.state = state
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.app(scope, receive, send)
+            return
+        if not self.state.draining:
+            try:
+                await self.app(scope, receive, send)
+            except asyncio.CancelledError:
+                self.state.requests_aborted += 1
+                raise
+            return
+        if scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1012})
+            return
+        response = JSONResponse(
+            {"detail": "Server is shutting down; retry shortly"},
+            status_code=503,
+            headers={"Retry-After": str(DRAIN_RETRY_AFTER_S), "Connection": "close"},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,111 @@
+# services/feature_codec.py
+"""
+Compact binary format for precomputed log-mel features (/classify/features).
+
+Edge stations compute features with the same audio_service code as the
+server and send only the (N_MELS, T) matrix. A fixed 20-byte header names
+the feature config it was computed with; the server refuses anything that
+doesn't match its own, since the model would silently misread it.
+
+Layout (little-endian):
+    magic        4s   b"MFEA"
+    format       B    FORMAT_VERSION
+    features     B    audio_service.FEATURE_VERSION
+    dtype        B    1 = float16, 2 = float32
+    flags        B    bit 0: payload is zlib-compressed
+    sample_rate  I    TARGET_SR
+    n_mels       H    N_MELS
+    n_fft        H    N_FFT
+    hop_length   H    HOP_LENGTH
+    n_frames     H    frames for DURATION seconds
+    payload           n_mels * n_frames values, row-major (mel, frame)
+"""
+import zlib
+import struct
+
+import numpy as np
+
+from .audio_service import TARGET_SR, DURATION, N_MELS, N_FFT, HOP_LENGTH, FEATURE_VERSION
+
+FEATURE_CONTENT_TYPE = "application/x-maitri-features"
+FORMAT_VERSION = 1
+MAGIC = b"MFEA"
+FLAG_ZLIB = 0x01
+
+_HEADER = struct.Struct("<4sBBBBIHHHH")
+_DTYPES = {1: np.dtype("<f2"), 2: np.dtype("<f4")}
+_DTYPE_CODES = {"float16": 1, "float32": 2}
+
+# frames extract_log_mel produces for a padded DURATION clip
+N_FRAMES = 1 + (int(TARGET_SR * DURATION) - N_FFT) // HOP_LENGTH
+
+
+class FeatureFormatError(ValueError):
+    """The payload is malformed or was computed with a different feature config."""
+
+
+def feature_config():
+    """What a client must match; also served by GET /classify/features/config."""
+    return {
+        "format_version": FORMAT_VERSION,
+        "feature_version": FEATURE_VERSION,
+        "sample_rate": TARGET_SR,
+        "n_mels": N_MELS,
+        "n_fft": N_FFT,
+        "hop_length": HOP_LENGTH,
+        "n_frames": N_FRAMES,
+        "dtypes": sorted(_DTYPE_CODES),
+    }
+
+
+def encode_features(features, dtype="float16", compress=False):
+    """make_model_input output ((1, 1, N_MELS, T) or (N_MELS, T)) -> bytes."""
+    feat = np.asarray(features).reshape(np.shape(features)[-2:])
+    code = _DTYPE_CODES[dtype]
+    payload = np.ascontiguousarray(feat, dtype=_DTYPES[code]).tobytes()
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= FLAG_ZLIB
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, FEATURE_VERSION, code, flags,
+        TARGET_SR, feat.shape[0], N_FFT, HOP_LENGTH, feat.shape[1],
+    )
+    return header + payload
+
+
+def decode_features(blob):
+    """bytes -> (1, 1, N_MELS, T) float32 model input; raises FeatureFormatError."""
+    if len(blob) < _HEADER.size:
+        raise FeatureFormatError("Payload shorter than the feature header")
+    magic, fmt, version, code, flags, sr, n_mels, n_fft, hop, n_frames = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise FeatureFormatError("Not a Maitri feature payload (bad magic)")
+    if fmt != FORMAT_VERSION:
+        raise FeatureFormatError(f"Unsupported format version {fmt}, expected {FORMAT_VERSION}")
+    got = {"feature_version": version, "sample_rate": sr, "n_mels": n_mels, "n_fft": n_fft,
+           "hop_length": hop, "n_frames": n_frames}
+    expected = feature_config()
+    mismatched = [f"{k}={v} (server: {expected[k]})" for k, v in got.items() if v != expected[k]]
+    if mismatched:
+        raise FeatureFormatError("Feature config mismatch: " + ", ".join(mismatched))
+    dtype = _DTYPES.get(code)
+    if dtype is None:
+        raise FeatureFormatError(f"Unknown dtype code {code}")
+    expected_len = n_mels * n_frames * dtype.itemsize
+    payload = memoryview(blob)[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        # never inflate more than one byte past the expected size (zip bombs)
+        inflater = zlib.decompressobj()
+        try:
+            payload = inflater.decompress(payload, expected_len + 1)
+        except zlib.error as e:
+            raise FeatureFormatError(f"Corrupt compressed payload: {e}")
+        if len(payload) > expected_len or inflater.unconsumed_tail:
+            raise FeatureFormatError(f"Compressed payload inflates past the expected {expected_len} bytes")
+    if len(payload) != expected_len:
+        raise FeatureFormatError(f"Payload holds {len(payload)} bytes, expected {expected_len}")
+    feat = np.frombuffer(payload, dtype=dtype).astype(np.float32).reshape(n_mels, n_frames)
+    if not np.isfinite(feat).all():
+        raise FeatureFormatError("Features contain NaN or infinity")
+    return feat[np.newaxis, np.newaxis, :, :]
@@ -0,0 +1,135 @@
+# services/feature_store.py
+"""
+Compact per-log feature vectors and bulk re-scoring.
+
+When MAITRI_FEATURE_STORE=1, every classification also keeps the compact
+vector the model scored (model_function.compact_features), stored as
+zlib-compressed float16 in the log_features table keyed by log id - about
+2-3 KB per row instead of the original audio.
+
+RescoreJob walks that table in id order and re-scores each batch with a
+single matrix product against the current signatures, so a model update
+can be applied to the whole history without re-decoding any audio. Rows
+whose predicted state changed are updated together with their rollups.
+"""
+import os
+import time
+import zlib
+import asyncio
+import logging
+from collections import Counter
+
+import numpy as np
+
+from ..database import db
+from . import json_log
+from ..models.model_function import emotion_labels, score_feature_matrix, signature_dim, model_version
+
+FEATURE_STORE_ENABLED = os.environ.get("MAITRI_FEATURE_STORE", "0") == "1"
+RESCORE_BATCH_ROWS = int(os.environ.get("MAITRI_RESCORE_BATCH_ROWS", "1024"))
+
+
+def encode_vector(vec):
+    return zlib.compress(np.asarray(vec, dtype=np.float16).tobytes())
+
+
+def decode_vector(blob):
+    return np.frombuffer(zlib.decompress(blob), dtype=np.float16)
+
+
+def score_blobs(blobs):
+    """
+    Worker-thread job: decode a batch of stored vectors and return the
+    best-matching emotion index per row (None where the stored dimension
+    doesn't match the current signatures).
+    """
+    vectors = [decode_vector(b) for b in blobs]
+    dim = signature_dim()
+    ok = [i for i, v in enumerate(vectors) if v.shape[0] == dim]
+    best = [None] * len(vectors)
+    if ok:
+        X = np.stack([vectors[i] for i in ok]).astype(np.float32)
+        for i, idx in zip(ok, np.argmax(score_feature_matrix(X), axis=1)):
+            best[i] = int(idx)
+    return best
+
+
+class RescoreJob:
+    def __init__(self, run_batch, batch_rows=RESCORE_BATCH_ROWS, on_changed=None):
+        """
+        `run_batch(fn, *args)` is an async callable that runs fn off the event
+        loop (the scheduler at batch priority); `on_changed()` is called once
+        at the end of a run that changed any stored state.
+        """
+        self._run_batch = run_batch
+        self.batch_rows = batch_rows
+        self._on_changed = on_changed
+        self._task = None
+        self.last = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start a run in the background; returns False if one is already running."""
+        if self.running:
+            return False
+        self._task = asyncio.create_task(self.run())
+        return True
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def run(self):
+        labels = emotion_labels()
+        report = {
+            "model_version": model_version(),
+            "started_at": int(time.time()),
+            "finished_at": None,
+            "processed": 0,
+            "changed": 0,
+            "skipped": 0,
+            "transitions": {},
+            "error": None,
+        }
+        self.last = report
+        transitions = Counter()
+        try:
+            async for rows in db.iter_feature_batches(self.batch_rows):
+                best = await self._run_batch(score_blobs, [r[1] for r in rows])
+                changes = []
+                for (log_id, _, state, accuracy, inference_time, ts), idx in zip(rows, best):
+                    if idx is None:
+                        report["skipped"] += 1
+                        continue
+                    new_state = labels[idx]
+                    if new_state != state:
+                        changes.append((log_id, state, new_state, accuracy, inference_time, ts))
+                        transitions[f"{state}->{new_state}"] += 1
+                if changes:
+                    await db.update_log_states(changes)
+                report["processed"] += len(rows)
+                report["changed"] += len(changes)
+                report["transitions"] = dict(transitions)
+        except asyncio.CancelledError:
+            report["error"] = "cancelled"
+            raise
+        except Exception as e:
+            report["error"] = str(e)
+            json_log.event(logging.WARNING, "rescore_failed", processed=report["processed"], error=str(e))
+        finally:
+            report["finished_at"] = int(time.time())
+            if report["changed"] and self._on_changed is not None:
+                self._on_changed()
+        json_log.event(logging.INFO, "rescore_finished", processed=report["processed"], changed=report["changed"])
+        return report
+
+    def stats(self):
+        return {"enabled": FEATURE_STORE_ENABLED, "running": self.running, "last_run": self.last}
@@ -0,0 +1,201 @@
+# services/history_export.py
+"""
+Streaming serializers for history exports.
+
+Turn the chunked row iterator from database.db.iter_history_range into
+response body chunks (NDJSON or CSV, optionally gzip-compressed) without
+ever holding more than one chunk of rows in memory.
+
+The columnar formats are for analytics clients: each chunk of rows is
+converted straight into typed NumPy arrays, so the client loads the whole
+range with one deserialization instead of building a dict per row.
+  - npz: a NumPy archive of one array per column (no pickled objects).
+    Numbers keep their SQLite types (NULL -> NaN for REAL columns); state is
+    dictionary-encoded as `state_codes` (int16, -1 = NULL) + `state_labels`;
+    user_message is Arrow-style `user_message_data` (UTF-8 bytes) +
+    `user_message_offsets` (n + 1 int64) + `user_message_valid`.
+    The archive needs every column, so it is assembled after the last chunk.
+  - arrow: an Arrow IPC stream, one record batch per chunk, sent as it is
+    produced. Only offered when pyarrow is installed.
+"""
+import io
+import csv
+import json
+import zlib
+import asyncio
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "npz": "application/octet-stream",
+}
+if pa is not None:
+    EXPORT_FORMATS["arrow"] = "application/vnd.apache.arrow.stream"
+
+COLUMNAR_FORMATS = ("npz", "arrow")
+
+# how each LOG_COLUMNS column is typed in the columnar formats
+_COLUMN_KINDS = {
+    "id": "int",
+    "timestamp": "int",
+    "accuracy": "float",
+    "inference_time": "float",
+    "state": "category",
+    "user_message": "text",
+}
+
+
+def _ndjson_chunk(columns, rows):
+    return "".join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+def _csv_chunk(rows):
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(rows)
+    return buf.getvalue()
+
+
+def _typed_columns(columns, rows):
+    """One chunk of row tuples -> {column: ndarray or list} (strings stay lists here)."""
+    out = {}
+    for name, values in zip(columns, zip(*rows)):
+        kind = _COLUMN_KINDS.get(name, "text")
+        if kind == "int":
+            out[name] = np.fromiter((0 if v is None else v for v in values), dtype=np.int64, count=len(values))
+        elif kind == "float":
+            out[name] = np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=len(values))
+        else:
+            out[name] = values
+    return out
+
+
+class _NpzBuilder:
+    """Accumulates typed chunks; build() writes the archive."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.parts = {name: [] for name in columns}
+        self.labels = {}            # category value -> code, per column
+        self.text_bytes = {}        # total UTF-8 bytes so far, per text column
+
+    def add(self, rows):
+        for name, values in _typed_columns(self.columns, rows).items():
+            kind = _COLUMN_KINDS.get(name, "text")
+            if kind == "category":
+                labels = self.labels.setdefault(name, {})
+                codes = np.fromiter(
+                    (-1 if v is None else labels.setdefault(v, len(labels)) for v in values),
+                    dtype=np.int16, count=len(values),
+                )
+                self.parts[name].append(codes)
+            elif kind == "text":
+                encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+                lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+                base = self.text_bytes.get(name, 0)
+                ends = base + np.cumsum(lengths)
+                self.text_bytes[name] = int(ends[-1]) if len(ends) else base
+                valid = np.fromiter((v is not None for v in values), dtype=bool, count=len(values))
+                self.parts[name].append((b"".join(encoded), ends, valid))
+            else:
+                self.parts[name].append(values)
+
+    def build(self):
+        arrays = {}
+        for name in self.columns:
+            kind = _COLUMN_KINDS.get(name, "text")
+            parts = self.parts[name]
+            if kind == "category":
+                arrays[name + "_codes"] = np.concatenate(parts) if parts else np.empty(0, np.int16)
+                arrays[name + "_labels"] = np.array(list(self.labels.get(name, {})), dtype=str)
+            elif kind == "text":
+                arrays[name + "_data"] = np.frombuffer(b"".join(p[0] for p in parts), dtype=np.uint8)
+                arrays[name + "_offsets"] = np.concatenate([np.zeros(1, np.int64)] + [p[1] for p in parts])
+                arrays[name + "_valid"] = np.concatenate([p[2] for p in parts]) if parts else np.empty(0, bool)
+            else:
+                dtype = np.int64 if kind == "int" else np.float64
+                arrays[name] = np.concatenate(parts) if parts else np.empty(0, dtype)
+        buf = io.BytesIO()
+        np.savez(buf, **arrays)
+        return buf.getvalue()
+
+
+def _arrow_batch(columns, rows):
+    typed = _typed_columns(columns, rows)
+    arrays = []
+    for name in columns:
+        values = typed[name]
+        if isinstance(values, np.ndarray):
+            # NaN from NULL REAL values goes back to a proper null
+            arrays.append(pa.array(values, from_pandas=values.dtype.kind == "f"))
+        else:
+            arrays.append(pa.array(values, type=pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, names=list(columns))
+
+
+def _arrow_schema(columns):
+    types = {"int": pa.int64(), "float": pa.float64()}
+    return pa.schema([(name, types.get(_COLUMN_KINDS.get(name, "text"), pa.string())) for name in columns])
+
+
+async def _columnar_body(row_chunks, columns, fmt):
+    if fmt == "npz":
+        builder = _NpzBuilder(columns)
+        async for rows in row_chunks:
+            builder.add(rows)
+        # zip assembly of a large range is CPU-heavy; keep it off the event loop
+        yield await asyncio.get_running_loop().run_in_executor(None, builder.build)
+        return
+    sink = io.BytesIO()
+    writer = pa.ipc.new_stream(sink, _arrow_schema(columns))
+
+    def drain():
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    async for rows in row_chunks:
+        writer.write_batch(_arrow_batch(columns, rows))
+        yield drain()
+    writer.close()
+    yield drain()
+
+
+async def export_body(row_chunks, columns, fmt="ndjson", compress=False):
+    """
+    Async generator of bytes for a StreamingResponse.
+    `row_chunks` is an async iterator of row-tuple lists in `columns` order.
+    """
+    # wbits=31 -> gzip container, so the stream can be served as Content-Encoding: gzip
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def emit(text):
+        data = text.encode("utf-8") if isinstance(text, str) else text
+        return gz.compress(data) if gz is not None else data
+
+    if fmt in COLUMNAR_FORMATS:
+        async for data in _columnar_body(row_chunks, columns, fmt):
+            out = emit(data)
+            if out:
+                yield out
+        if gz is not None:
+            yield gz.flush()
+        return
+
+    if fmt == "csv":
+        out = emit(",".join(columns) + "\n")
+        if out:
+            yield out
+    async for rows in row_chunks:
+        out = emit(_csv_chunk(rows) if fmt == "csv" else _ndjson_chunk(columns, rows))
+        if out:
+            yield out
+    if gz is not None:
+        yield gz.flush()
@@ -0,0 +1,72 @@
+# services/json_log.py
+"""
+Structured (one JSON object per line) logging that never blocks the event loop.
+
+Handlers only put the record on an in-memory queue (QueueHandler); a
+QueueListener thread formats it and writes it to stderr. Extra fields are
+passed as `log.info("event", extra={"fields": {...}})` and end up as
+top-level keys of the JSON line.
+"""
+import os
+import sys
+import json
+import queue
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.environ.get("MAITRI_LOG_LEVEL", "INFO").upper()
+
+log = logging.getLogger("maitri")
+
+_queue = queue.SimpleQueue()
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _PreparedQueueHandler(QueueHandler):
+    # QueueHandler.prepare() formats the message with the default formatter
+    # and drops exc_info; the listener's JsonFormatter needs the raw record
+    def prepare(self, record):
+        return record
+
+
+# attached at import, so nothing logged before startup falls through to the root logger
+log.addHandler(_PreparedQueueHandler(_queue))
+log.setLevel(LOG_LEVEL)
+log.propagate = False
+
+
+def start():
+    """Start the writer thread; records logged before this wait in the queue."""
+    global _listener
+    if _listener is None:
+        stream = logging.StreamHandler(sys.stderr)
+        stream.setFormatter(JsonFormatter())
+        _listener = QueueListener(_queue, stream, respect_handler_level=True)
+        _listener.start()
+
+
+def stop():
+    """Write out everything queued so far and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def event(level, name, **fields):
+    """log.<level>(name) with `fields` as extra JSON keys."""
+    log.log(level, name, extra={"fields": fields})
@@ -0,0 +1,161 @@
+# services/log_writer.py
+"""
+Write-behind queue for DB logging.
+
+Request handlers hand rows to LogWriter.submit(), which never blocks and
+never spawns a task. A single background task drains the bounded queue
+and writes rows in batches (one transaction per batch), whenever
+LOG_BATCH_ROWS rows are waiting or LOG_FLUSH_MS has passed since the
+first row of the batch arrived. When the queue is full new rows are
+dropped and counted rather than piling up in memory.
+"""
+import os
+import time
+import asyncio
+import logging
+
+from . import json_log
+from .metrics import observe_stage
+
+LOG_QUEUE_SIZE = int(os.environ.get("MAITRI_LOG_QUEUE_SIZE", "10000"))
+LOG_BATCH_ROWS = int(os.environ.get("MAITRI_LOG_BATCH_ROWS", "256"))
+LOG_FLUSH_MS = int(os.environ.get("MAITRI_LOG_FLUSH_MS", "200"))
+
+_STOP = object()
+
+
+class LogWriter:
+    def __init__(self, write_batch, max_queue=LOG_QUEUE_SIZE, batch_rows=LOG_BATCH_ROWS, flush_ms=LOG_FLUSH_MS, on_written=None):
+        """
+        `write_batch` is an async callable taking a list of row tuples and
+        returning their new ids; `on_written(rows, ids)` is called after each
+        successful batch.
+        """
+        self._write_batch = write_batch
+        self._on_written = on_written
+        self._max_queue = max_queue
+        self._batch_rows = max(1, batch_rows)
+        self._flush_s = flush_ms / 1000.0
+        self._queue = None
+        self._task = None
+        self._batch = []            # rows taken off the queue and not yet written or failed
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+
+    @property
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self._max_queue)
+            self._task = asyncio.create_task(self._run(self._queue))
+
+    def submit(self, row):
+        """Queue one row; returns False (and counts a drop) if the queue is full or not running."""
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def stop(self, timeout=10.0):
+        """
+        Flush everything queued so far and stop the background task.
+        Returns the number of rows that could not be written in time.
+        """
+        if self._task is None:
+            return 0
+        queue, task = self._queue, self._task
+        self._queue = None          # refuse new rows from here on
+        try:
+            queue.put_nowait(_STOP)
+        except asyncio.QueueFull:
+            # make room for the sentinel; that row counts as lost
+            queue.get_nowait()
+            self.dropped += 1
+            queue.put_nowait(_STOP)
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        # the batch being collected or written when the task was cancelled is lost too
+        lost = len(self._batch)
+        self._batch = []
+        while not queue.empty():
+            if queue.get_nowait() is not _STOP:
+                lost += 1
+        self.dropped += lost
+        return lost
+
+    async def _run(self, queue):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            if item is _STOP:
+                break
+            batch = self._batch = [item]
+            flush_at = loop.time() + self._flush_s
+            while len(batch) < self._batch_rows:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = flush_at - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(queue.get(), remaining)
+                    except asyncio.TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            self._batch = []
+
+    async def _flush(self, batch):
+        t0 = time.perf_counter()
+        try:
+            ids = await self._write_batch(batch)
+            observe_stage("db_log", time.perf_counter() - t0)
+        except Exception as e:
+            self.failed += len(batch)
+            json_log.event(logging.WARNING, "log_batch_failed", rows=len(batch), error=str(e))
+            return
+        if self._on_written is not None:
+            self._on_written(batch, ids)
+        self.written += len(batch)
+        self.batches += 1
+        self.last_batch_size = len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+
+    def stats(self):
+        return {
+            "queue_depth": self.depth,
+            "queue_capacity": self._max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_size,
+            "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+        }
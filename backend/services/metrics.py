@@ -0,0 +1,193 @@
+# services/metrics.py
+"""
+In-process metrics in the Prometheus text exposition format (GET /metrics).
+
+Only what the backend needs, without a client library: fixed-bucket
+histograms and labelled counters, each guarded by a small lock because
+the pipeline stages are timed on executor threads. Recording a sample is
+a perf_counter pair, a bisect and two increments.
+
+Per-stage latency (maitri_stage_duration_seconds{stage=...}):
+    upload_read  reading / hashing the request body
+    decode       container decode (soundfile) or raw PCM conversion
+    resample     resampling to TARGET_SR (only when the input rate differs)
+    features     log-mel extraction
+    scoring      run_emotion_model
+    db_log       one log-writer batch transaction
+"""
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+from .request_timing import record as record_request_stage
+
+STAGES = ("upload_read", "decode", "resample", "features", "scoring", "db_log")
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values):
+    return ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, name, labels=""):
+        sep = "," if labels else ""
+        with self._lock:
+            counts, total, n = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, c in zip(self.buckets + ("+Inf",), counts):
+            cumulative += c
+            lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {total}")
+        lines.append(f"{name}_count{{{labels}}} {n}")
+        return lines
+
+
+class HistogramFamily:
+    """Histograms keyed by label values, created on first use."""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, Histogram(self.buckets))
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, _labels(self.label_names, values)))
+        return lines
+
+
+class CounterFamily:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *values, amount=1):
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, v in items:
+            lines.append(f"{self.name}{{{_labels(self.label_names, values)}}} {v}")
+        return lines
+
+
+stage_duration = HistogramFamily(
+    "maitri_stage_duration_seconds", "Time spent in each request pipeline stage.", ("stage",),
+)
+request_duration = HistogramFamily(
+    "maitri_http_request_duration_seconds", "HTTP request latency by handler.", ("handler",),
+)
+requests_total = CounterFamily(
+    "maitri_http_requests_total", "HTTP requests by handler and status code.", ("handler", "status"),
+)
+
+
+def observe_stage(stage, seconds):
+    """Record a stage duration in the histogram and in the current request's Server-Timing."""
+    stage_duration.labels(stage).observe(seconds)
+    record_request_stage(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - t0)
+
+
+def process_rss_bytes():
+    """Current resident set size, or None where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def gauge_lines(name, help_text, samples, kind="gauge"):
+    """samples: list of (labels dict, value); entries with a None value are skipped."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        label_str = _labels(labels.keys(), labels.values())
+        lines.append(f"{name}{{{label_str}}} {value}" if label_str else f"{name} {value}")
+    return lines
+
+
+def render(extra_lines=()):
+    lines = []
+    lines.extend(requests_total.render())
+    lines.extend(request_duration.render())
+    lines.extend(stage_duration.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware counting HTTP requests and their latency per handler.
+    The handler label is the matched endpoint's name (bounded cardinality,
+    unlike raw paths such as /results/<sha256>).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", "unmatched")
+            requests_total.inc(handler, status)
+            request_duration.labels(handler).observe(time.perf_counter() - t0)
@@ -0,0 +1,142 @@
+# services/rate_limit.py
+"""
+Per-client token-bucket rate limiting for the classify endpoints.
+
+A client is its X-API-Key header if it sends one, its remote address
+otherwise. Each client gets a bucket of `burst` tokens refilled at `rate`
+tokens per second; a request takes one token or is answered 429 with a
+Retry-After header - from the middleware, before the body is read, so a
+runaway notebook loop costs neither upload spooling nor decoding. CORS
+preflight (OPTIONS) requests are never charged: a browser request with
+custom headers would otherwise pay twice and could fail at preflight.
+
+Buckets live in an OrderedDict in least-recently-used order: a check is a
+dict lookup, a little arithmetic and a move_to_end. A bucket idle long
+enough to have refilled completely is indistinguishable from a new one,
+so the periodic cleanup pops those from the front and stops at the first
+bucket still in use.
+
+Off unless MAITRI_RATE_LIMIT_RPS is set. MAITRI_RATE_LIMIT_OVERRIDES gives
+individual clients their own limits: "client=rate:burst,..." where client
+is an API key or an address.
+"""
+import os
+import math
+import time
+from collections import OrderedDict
+
+from starlette.responses import JSONResponse
+
+RATE_LIMIT_RPS = float(os.environ.get("MAITRI_RATE_LIMIT_RPS", "0"))
+RATE_LIMIT_BURST = float(os.environ.get("MAITRI_RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_OVERRIDES = os.environ.get("MAITRI_RATE_LIMIT_OVERRIDES", "")
+# how often idle buckets are swept, in seconds
+CLEANUP_INTERVAL_S = 10.0
+
+
+def parse_overrides(spec):
+    """Parse "a=2:10,10.0.0.5=0.5:4" into {"a": (2.0, 10.0), "10.0.0.5": (0.5, 4.0)}."""
+    overrides = {}
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        client, _, limits = entry.rpartition("=")
+        rate, _, burst = limits.partition(":")
+        if not client or not rate:
+            raise ValueError(f"Bad rate limit override '{entry}', expected client=rate:burst")
+        overrides[client] = (float(rate), float(burst) if burst else RATE_LIMIT_BURST)
+    return overrides
+
+
+class TokenBuckets:
+    def __init__(self, rate=RATE_LIMIT_RPS, burst=RATE_LIMIT_BURST, overrides=None):
+        self.rate = rate
+        self.burst = burst
+        self.overrides = overrides or {}
+        self._buckets = OrderedDict()   # client -> [tokens, last refill time], least recently used first
+        self._next_cleanup = 0.0
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self):
+        return self.rate > 0 or bool(self.overrides)
+
+    def limits_for(self, client):
+        return self.overrides.get(client, (self.rate, self.burst))
+
+    def take(self, client, now=None):
+        """Take one token for `client`; returns 0.0 if allowed, else seconds until a token is available."""
+        rate, burst = self.limits_for(client)
+        if rate <= 0:
+            self.allowed += 1
+            return 0.0
+        now = time.monotonic() if now is None else now
+        if now >= self._next_cleanup:
+            self._cleanup(now)
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [burst, now]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(client)
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            self.allowed += 1
+            return 0.0
+        self.limited += 1
+        return (1.0 - bucket[0]) / rate
+
+    def _cleanup(self, now):
+        self._next_cleanup = now + CLEANUP_INTERVAL_S
+        while self._buckets:
+            client, (tokens, last) = next(iter(self._buckets.items()))
+            rate, burst = self.limits_for(client)
+            if rate > 0 and tokens + (now - last) * rate < burst:
+                break
+            del self._buckets[client]
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "rate": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+def client_id(scope):
+    for name, value in scope["headers"]:
+        if name == b"x-api-key":
+            return value.decode("latin-1")
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware applying `buckets` to HTTP requests under `path_prefix`."""
+
+    def __init__(self, app, buckets, path_prefix="/classify"):
+        self.app = app
+        self.buckets = buckets
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] == "OPTIONS" or not self.buckets.enabled
+                or not scope["path"].startswith(self.path_prefix)):
+            await self.app(scope, receive, send)
+            return
+        wait = self.buckets.take(client_id(scope))
+        if wait:
+            response = JSONResponse(
+                {"detail": f"Rate limit exceeded; retry in {wait:.2f} s"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -0,0 +1,100 @@
+# services/recent_buffer.py
+"""
+Hot in-memory ring buffer of recently logged classifications.
+
+Filled by the log writer right after each batch commits (so every entry
+has its real row id), it answers the common /history calls - the last few
+minutes or the last N entries - without touching SQLite.
+
+The buffer tracks `covered_after`: every row with a timestamp strictly
+greater than it is guaranteed to be in the buffer. A query is served from
+memory only when that guarantee makes the answer exact; anything reaching
+further back falls through to SQLite.
+
+Only valid while this process is the sole writer of the database.
+"""
+import os
+import time
+from collections import deque
+
+RECENT_BUFFER_SIZE = int(os.environ.get("MAITRI_RECENT_BUFFER_SIZE", "2048"))
+
+
+class RecentBuffer:
+    def __init__(self, max_entries=RECENT_BUFFER_SIZE):
+        self._max = max_entries
+        self._rows = deque()
+        # rows logged before this process started aren't in memory
+        self.covered_after = int(time.time())
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self._max > 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def extend(self, rows):
+        """Append committed rows (LOG_COLUMNS tuples, ascending id)."""
+        if not self.enabled:
+            return
+        for row in rows:
+            if self._rows and row[5] < self._rows[-1][5]:
+                # wall clock went backwards; the buffer is no longer in timestamp order
+                self.reset()
+            self._rows.append(row)
+            if len(self._rows) > self._max:
+                evicted = self._rows.popleft()
+                self.covered_after = max(self.covered_after, evicted[5])
+
+    def reset(self):
+        """Forget everything; only rows logged from now on will be served."""
+        newest = self._rows[-1][5] if self._rows else 0
+        self._rows.clear()
+        self.covered_after = max(int(time.time()), newest)
+
+    def drop_through(self, max_id):
+        """Remove entries with id <= max_id (they were deleted from the database)."""
+        while self._rows and self._rows[0][0] <= max_id:
+            self._rows.popleft()
+
+    def query(self, cutoff_ts, limit, cursor=None, state=None):
+        """
+        Newest-first rows with timestamp >= cutoff_ts, optional state filter and
+        (timestamp, id) < cursor - exactly what db.get_history would return - or
+        None when the buffer can't guarantee a complete answer.
+        """
+        if not self.enabled:
+            return None
+        out = []
+        for row in reversed(self._rows):
+            if row[5] < cutoff_ts or row[5] <= self.covered_after:
+                break
+            if cursor is not None and (row[5], row[0]) >= cursor:
+                continue
+            if state is not None and row[1] != state:
+                continue
+            out.append(row)
+            if len(out) >= limit:
+                # every older row is older than these, wherever it lives
+                self.hits += 1
+                return out
+        if cutoff_ts > self.covered_after:
+            # the whole window lies inside the covered range
+            self.hits += 1
+            return out
+        self.misses += 1
+        return None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._rows),
+            "max_entries": self._max,
+            "covered_after": self.covered_after,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
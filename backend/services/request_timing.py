@@ -0,0 +1,115 @@
+# services/request_timing.py
+"""
+Per-request stage timings: a Server-Timing header and one JSON log line.
+
+RequestTimingMiddleware gives each request an id (the client's
+X-Request-ID if it sent a sane one) and an empty list of timings in a
+context variable. Pipeline stages append to it through record() - the
+metrics timers do that already - including stages run on executor
+threads, because the scheduler runs every job in its submitter's context.
+When the response starts, the timings go out as
+
+    Server-Timing: upload_read;dur=0.41, decode;dur=1.92, ..., total;dur=14.3
+    X-Request-ID: 6f1c...
+
+and when it ends, as a structured "request" log line with the same values.
+
+Work coalesced with an identical in-flight upload is timed in the request
+that started it; the others only show their own stages and the cache note.
+"""
+import re
+import time
+import uuid
+import logging
+from contextvars import ContextVar
+
+from . import json_log
+
+_timings = ContextVar("maitri_request_timings", default=None)
+_REQUEST_ID_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def record(stage, seconds):
+    """Add a stage duration to the current request, if there is one."""
+    timings = _timings.get()
+    if timings is not None:
+        # list.append is atomic, so worker threads of a batch can share the list
+        timings.append((stage, seconds, None))
+
+
+def note(name, desc):
+    """Attach a duration-less marker (e.g. cache=hit) to the current request."""
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, None, desc))
+
+
+def _summarize(timings):
+    # a stage run more than once (batch files, decode + resample per file) is summed
+    stages, notes = {}, {}
+    for name, seconds, desc in list(timings):
+        if seconds is None:
+            notes[name] = desc
+        else:
+            stages[name] = stages.get(name, 0.0) + seconds
+    return stages, notes
+
+
+def server_timing_header(timings, total_seconds):
+    stages, notes = _summarize(timings)
+    parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in stages.items()]
+    parts += [f'{name};desc="{desc}"' for name, desc in notes.items()]
+    parts.append(f"total;dur={total_seconds * 1000:.3f}")
+    return ", ".join(parts)
+
+
+class RequestTimingMiddleware:
+    """Pure ASGI middleware; only requests under `path_prefix` are timed."""
+
+    def __init__(self, app, path_prefix="/classify"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _REQUEST_ID_RE.match(candidate):
+                    request_id = candidate
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex
+        timings = []
+        token = _timings.set(timings)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings, time.perf_counter() - t0).encode()))
+                headers.append((b"x-request-id", request_id.encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            stages, notes = _summarize(timings)
+            json_log.event(
+                logging.INFO, "request",
+                request_id=request_id,
+                method=scope["method"],
+                path=scope["path"],
+                status=status,
+                duration_ms=round((time.perf_counter() - t0) * 1000, 3),
+                stages_ms={name: round(seconds * 1000, 3) for name, seconds in stages.items()},
+                **notes,
+            )
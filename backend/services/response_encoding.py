@@ -0,0 +1,142 @@
+# services/response_encoding.py
+"""
+Content-negotiated response bodies for the row-heavy endpoints
+(/history, /history/search, /classify/batch).
+
+FastAPI's default path runs every value through jsonable_encoder before
+json.dumps, which costs more than the query itself for a few thousand
+rows. Here the handler returns a plain dict whose row lists are wrapped in
+Rows(columns, rows): the database tuples are written out as objects
+directly - no dict per row - by orjson when it is installed (stdlib json
+otherwise), or as MessagePack when the client sends
+`Accept: application/msgpack` and msgpack is installed.
+
+The JSON body is the same as before, key for key; MessagePack bodies have
+the same structure.
+"""
+import json
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+RESPONSE_MEDIA_TYPES = [JSON_MEDIA_TYPE]
+if msgpack is not None:
+    RESPONSE_MEDIA_TYPES += MSGPACK_MEDIA_TYPES
+
+
+class Rows:
+    """Rows (tuples in `columns` order) to be encoded as a list of objects."""
+    __slots__ = ("columns", "rows")
+
+    def __init__(self, columns, rows):
+        self.columns = tuple(columns)
+        self.rows = rows
+
+
+if orjson is not None:
+    _dumps = orjson.dumps
+else:
+    def _dumps(value):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _json_rows(rows):
+    # one bytes template per column set; each row is a single %-format of its encoded values
+    template = b"{" + b",".join(_dumps(c) + b":%b" for c in rows.columns) + b"}"
+    dumps = _dumps
+    return b"[" + b",".join([template % tuple(map(dumps, row)) for row in rows.rows]) + b"]"
+
+
+def encode_json(payload):
+    """`payload` is a dict; Rows values are written row by row, everything else as usual."""
+    parts = []
+    for key, value in payload.items():
+        body = _json_rows(value) if isinstance(value, Rows) else _dumps(value)
+        parts.append(_dumps(key) + b":" + body)
+    return b"{" + b",".join(parts) + b"}"
+
+
+def encode_msgpack(payload):
+    packer = msgpack.Packer()
+    out = [packer.pack_map_header(len(payload))]
+    for key, value in payload.items():
+        out.append(packer.pack(key))
+        if not isinstance(value, Rows):
+            out.append(packer.pack(value))
+            continue
+        out.append(packer.pack_array_header(len(value.rows)))
+        header = packer.pack_map_header(len(value.columns))
+        keys = [packer.pack(c) for c in value.columns]
+        for row in value.rows:
+            out.append(header)
+            for key_bytes, item in zip(keys, row):
+                out.append(key_bytes)
+                out.append(packer.pack(item))
+    return b"".join(out)
+
+
+def negotiate(accept):
+    """
+    Media type for an Accept header: MessagePack if the client prefers it
+    (and it is available), JSON otherwise. Other types are ignored, as
+    before; 406 only when the client asked for MessagePack alone and this
+    server can't produce it.
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+    best, best_q = None, 0.0
+    wants_msgpack = False
+    for entry in accept.split(","):
+        media_type, _, params = entry.strip().partition(";")
+        media_type = media_type.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type in ("*/*", "application/*", JSON_MEDIA_TYPE):
+            candidate = JSON_MEDIA_TYPE
+        elif media_type in MSGPACK_MEDIA_TYPES:
+            wants_msgpack = True
+            if msgpack is None:
+                continue
+            candidate = media_type
+        else:
+            continue
+        # ties go to the earlier entry
+        if q > best_q:
+            best, best_q = candidate, q
+    if best is None:
+        if not wants_msgpack:
+            return JSON_MEDIA_TYPE
+        raise HTTPException(
+            status_code=406,
+            detail=f"Not acceptable; available response types: {', '.join(RESPONSE_MEDIA_TYPES)}",
+        )
+    return best
+
+
+def encoded_response(payload, accept=None, status_code=200, headers=None):
+    """Response for `payload` in the representation the Accept header asks for."""
+    media_type = negotiate(accept)
+    body = encode_json(payload) if media_type == JSON_MEDIA_TYPE else encode_msgpack(payload)
+    response_headers = {"Vary": "Accept"}
+    if headers:
+        response_headers.update(headers)
+    return Response(content=body, status_code=status_code, media_type=media_type, headers=response_headers)
@@ -0,0 +1,50 @@
+# services/result_cache.py
+"""
+Small LRU cache of classification results keyed by audio content hash.
+
+Lets /classify skip decode + inference for audio it has already scored,
+and lets clients ask for a result by hash before uploading anything.
+Only touched from the event loop, so no locking.
+"""
+import os
+from collections import OrderedDict
+
+RESULT_CACHE_SIZE = int(os.environ.get("MAITRI_RESULT_CACHE_SIZE", "1024"))
+
+
+class ResultCache:
+    def __init__(self, max_entries=RESULT_CACHE_SIZE):
+        self._max = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key, result):
+        if self._max <= 0:
+            return
+        self._entries[key] = result
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self._max,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
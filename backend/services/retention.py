@@ -0,0 +1,147 @@
+# services/retention.py
+"""
+Retention and compaction for the logs database.
+
+A background job that periodically removes log rows outside the policy
+(older than MAITRI_RETENTION_DAYS and/or beyond the newest
+MAITRI_RETENTION_MAX_ROWS rows). Rows are deleted in small batches with a
+short pause in between so no single write transaction holds the lock for
+long, and can be appended to gzip NDJSON archives first. Freed pages are
+then handed back to the filesystem with incremental vacuum, a bounded
+number of pages at a time. Both rules are off (0) by default.
+"""
+import os
+import gzip
+import json
+import time
+import asyncio
+import logging
+
+from ..database import db
+from . import json_log
+
+RETENTION_DAYS = float(os.environ.get("MAITRI_RETENTION_DAYS", "0"))
+RETENTION_MAX_ROWS = int(os.environ.get("MAITRI_RETENTION_MAX_ROWS", "0"))
+RETENTION_ARCHIVE_DIR = os.environ.get("MAITRI_RETENTION_ARCHIVE_DIR", "")
+RETENTION_INTERVAL_S = float(os.environ.get("MAITRI_RETENTION_INTERVAL_S", "3600"))
+RETENTION_BATCH_ROWS = int(os.environ.get("MAITRI_RETENTION_BATCH_ROWS", "500"))
+# pause between batches so request logging gets the write lock in between
+RETENTION_BATCH_PAUSE_S = 0.05
+VACUUM_PAGES_PER_STEP = 256
+
+
+class RetentionJob:
+    def __init__(self, days=RETENTION_DAYS, max_rows=RETENTION_MAX_ROWS, archive_dir=RETENTION_ARCHIVE_DIR,
+                 interval_s=RETENTION_INTERVAL_S, batch_rows=RETENTION_BATCH_ROWS, on_delete=None):
+        """`on_delete(ids)` is called after each batch of rows is deleted."""
+        self.days = days
+        self.max_rows = max_rows
+        self.archive_dir = archive_dir
+        self.interval_s = interval_s
+        self.batch_rows = batch_rows
+        self._on_delete = on_delete
+        self._task = None
+        self.runs = 0
+        self.deleted = 0
+        self.archived = 0
+        self.vacuumed_pages = 0
+        self.last_run = None
+        self.last_error = None
+
+    @property
+    def enabled(self):
+        return self.days > 0 or self.max_rows > 0
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                json_log.event(logging.WARNING, "retention_failed", error=str(e))
+            await asyncio.sleep(self.interval_s)
+
+    async def run_once(self):
+        """Apply the policy once; returns the number of rows removed."""
+        cutoff_ts = int(time.time() - self.days * 86400) if self.days > 0 else 0
+        max_id = await db.retention_id_threshold(self.max_rows) if self.max_rows > 0 else 0
+        archive_path = None
+        if self.archive_dir:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            archive_path = os.path.join(self.archive_dir, time.strftime("logs_%Y%m%dT%H%M%SZ.ndjson.gz", time.gmtime()))
+
+        removed = 0
+        while True:
+            rows = await db.fetch_expired_logs(cutoff_ts, max_id, self.batch_rows)
+            if not rows:
+                break
+            if archive_path is not None:
+                # archive before deleting, off the event loop
+                await asyncio.get_running_loop().run_in_executor(None, _append_archive, archive_path, rows)
+                self.archived += len(rows)
+            ids = [r[0] for r in rows]
+            await db.delete_logs(ids, keep_hourly_before=cutoff_ts)
+            if self._on_delete is not None:
+                self._on_delete(ids)
+            removed += len(rows)
+            self.deleted += len(rows)
+            if len(rows) < self.batch_rows:
+                break
+            await asyncio.sleep(RETENTION_BATCH_PAUSE_S)
+
+        if cutoff_ts:
+            # hourly rollups are tiny and keep aged-out rows; minute rollups follow the age rule
+            await db.prune_rollups("minute", cutoff_ts)
+        if removed:
+            await self._vacuum()
+        self.runs += 1
+        self.last_run = int(time.time())
+        self.last_error = None
+        if removed:
+            json_log.event(logging.INFO, "retention_removed", rows=removed, archive=archive_path)
+        return removed
+
+    async def _vacuum(self):
+        while True:
+            freed, remaining = await db.incremental_vacuum(VACUUM_PAGES_PER_STEP)
+            self.vacuumed_pages += freed
+            # freed == 0: nothing left, or the file isn't in incremental auto-vacuum mode
+            if not remaining or not freed:
+                break
+            await asyncio.sleep(RETENTION_BATCH_PAUSE_S)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "max_age_days": self.days,
+            "max_rows": self.max_rows,
+            "archive_dir": self.archive_dir or None,
+            "runs": self.runs,
+            "deleted": self.deleted,
+            "archived": self.archived,
+            "vacuumed_pages": self.vacuumed_pages,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+        }
+
+
+def _append_archive(path, rows):
+    # gzip files can be appended to; readers see one continuous NDJSON stream
+    with gzip.open(path, "at", encoding="utf-8") as fh:
+        for row in rows:
+            fh.write(json.dumps(dict(zip(db.LOG_COLUMNS, row)), ensure_ascii=False) + "\n")
@@ -0,0 +1,184 @@
+# services/scheduler.py
+"""
+Priority- and deadline-aware scheduling in front of the inference thread pool.
+
+The ThreadPoolExecutor on its own is a single FIFO queue, so a notebook
+pushing hundreds of evaluation files delays every live recording behind it.
+PriorityScheduler keeps at most `max_workers` jobs inside the executor and
+holds everything else in its own heap, ordered by priority class first and
+arrival order second. When a slot frees up it picks the next job, and jobs
+whose deadline has already passed are dropped instead of computed.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from collections import deque
+
+from .request_timing import record as record_request_stage
+
+# lower rank is served first
+PRIORITY_CLASSES = {"interactive": 0, "batch": 1}
+DEFAULT_PRIORITY = "interactive"
+
+# number of recent samples kept per class for the latency percentiles
+_LATENCY_WINDOW = 1024
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a job's deadline passed before a worker picked it up."""
+
+
+def _percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class _ClassStats:
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.wait = deque(maxlen=_LATENCY_WINDOW)
+        self.latency = deque(maxlen=_LATENCY_WINDOW)
+
+    def snapshot(self, queued):
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "queued": queued,
+            "wait_ms_p50": round(_percentile(self.wait, 0.50) * 1000, 2),
+            "wait_ms_p95": round(_percentile(self.wait, 0.95) * 1000, 2),
+            "latency_ms_p50": round(_percentile(self.latency, 0.50) * 1000, 2),
+            "latency_ms_p95": round(_percentile(self.latency, 0.95) * 1000, 2),
+        }
+
+
+class PriorityScheduler:
+    """
+    Runs blocking callables on `executor`, never more than `max_workers` at a time.
+    Must be used from a single event loop (the app's loop).
+    """
+
+    def __init__(self, executor, max_workers):
+        self._executor = executor
+        self._slots = max_workers
+        self._active = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._stats = {name: _ClassStats() for name in PRIORITY_CLASSES}
+
+    @property
+    def active(self):
+        return self._active
+
+    @property
+    def queued(self):
+        return len(self._heap)
+
+    async def submit(self, fn, *args, priority=DEFAULT_PRIORITY, deadline=None, key=None):
+        """
+        Queue fn(*args) and wait for its result.
+        `deadline` is an absolute time.monotonic() value or None.
+        `key` names the job for escalate() while it is queued.
+        Raises DeadlineExceeded if the job was dropped unstarted.
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        # the job runs in the submitter's context, so per-request timings made
+        # on the worker thread land in the right request
+        ctx = contextvars.copy_context()
+        job = (PRIORITY_CLASSES[priority], next(self._seq), time.monotonic(), deadline, priority, fn, args, fut, ctx, key)
+        heapq.heappush(self._heap, job)
+        self._stats[priority].submitted += 1
+        self._dispatch()
+        return await fut
+
+    def escalate(self, key, priority, deadline):
+        """
+        Another caller is waiting on the queued job named `key`: serve it at
+        the more urgent of the two priorities, and keep it until the later of
+        the two deadlines (None meaning no deadline). The job keeps counting
+        under the class it was submitted with. Returns False if no such job
+        is queued (already running, finished, or never submitted).
+        """
+        for i, job in enumerate(self._heap):
+            if job[9] == key and key is not None and not job[7].done():
+                break
+        else:
+            return False
+        rank = min(job[0], PRIORITY_CLASSES[priority])
+        loosest = None if job[3] is None or deadline is None else max(job[3], deadline)
+        if (rank, loosest) != (job[0], job[3]):
+            self._heap[i] = (rank, job[1], job[2], loosest) + job[4:]
+            heapq.heapify(self._heap)
+        return True
+
+    async def drain(self, timeout):
+        """
+        Wait up to `timeout` seconds for queued and running jobs to finish
+        (shutdown). Jobs still queued then are cancelled; running ones can't
+        be interrupted and their results are discarded. Returns
+        (drained, aborted) job counts.
+        """
+        pending = self._active + sum(1 for job in self._heap if not job[7].done())
+        deadline = time.monotonic() + timeout
+        while (self._active or self._heap) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        aborted = self._active
+        while self._heap:
+            fut = heapq.heappop(self._heap)[7]
+            if not fut.done():
+                fut.cancel()
+                aborted += 1
+        return max(0, pending - aborted), aborted
+
+    def _dispatch(self):
+        while self._active < self._slots and self._heap:
+            _, _, enqueued, deadline, priority, fn, args, fut, ctx, _ = heapq.heappop(self._heap)
+            if fut.done():
+                # caller went away (client disconnected) while the job was queued
+                continue
+            stats = self._stats[priority]
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                stats.dropped += 1
+                fut.set_exception(DeadlineExceeded("Deadline passed before processing started"))
+                continue
+            stats.wait.append(now - enqueued)
+            ctx.run(record_request_stage, "queue_wait", now - enqueued)
+            self._active += 1
+            cf = asyncio.get_running_loop().run_in_executor(self._executor, ctx.run, fn, *args)
+            cf.add_done_callback(lambda done, fut=fut, stats=stats, enqueued=enqueued: self._finish(done, fut, stats, enqueued))
+
+    def _finish(self, done, fut, stats, enqueued):
+        self._active -= 1
+        stats.latency.append(time.monotonic() - enqueued)
+        if done.exception() is not None:
+            stats.failed += 1
+            if not fut.done():
+                fut.set_exception(done.exception())
+        else:
+            stats.completed += 1
+            if not fut.done():
+                fut.set_result(done.result())
+        self._dispatch()
+
+    def stats(self):
+        queued = {name: 0 for name in PRIORITY_CLASSES}
+        for job in self._heap:
+            queued[job[4]] += 1
+        return {
+            "workers": self._slots,
+            "active": self._active,
+            "classes": {name: s.snapshot(queued[name]) for name, s in self._stats.items()},
+        }
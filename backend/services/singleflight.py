@@ -0,0 +1,54 @@
+# services/singleflight.py
+"""
+Coalesce identical concurrent work.
+
+If a second request arrives for a key whose computation is still running,
+it attaches to that computation instead of starting another one. The work
+runs as its own task, so a client that disconnects early doesn't cancel
+the result for everyone else waiting on it.
+"""
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}
+        self.started = 0
+        self.coalesced = 0
+
+    @property
+    def inflight(self):
+        return len(self._inflight)
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    async def do(self, key, make_coro):
+        """
+        Return the result of `make_coro()` for `key`, sharing it with any
+        concurrent caller using the same key. `make_coro` is only called
+        by the first caller.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(make_coro())
+            self._inflight[key] = task
+            self.started += 1
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "inflight": self.inflight,
+        }
@@ -0,0 +1,131 @@
+# services/stream_features.py
+"""
+Incremental features for streamed audio (/ws/stream).
+
+A StreamingFeatures object lives for one WebSocket connection. Incoming
+PCM chunks are mixed to mono, resampled to TARGET_SR on the fly and cut
+into STFT frames as soon as a full frame is available, so each frame's
+FFT and mel bands are computed exactly once however often the window is
+classified. push() does that work and belongs on a worker thread;
+snapshot() copies the latest window on the event loop and
+window_features() then only has to log-scale and standardize those mel
+frames.
+
+Frames start on HOP_LENGTH boundaries from the start of the stream, which
+is exactly how extract_log_mel frames a clip: a full window gives the same
+features /classify would for those DURATION seconds of audio. Until the
+first window fills up, the audio so far is zero-padded like a short clip.
+"""
+from collections import deque
+
+import numpy as np
+
+from .audio_service import (
+    TARGET_SR, DURATION, N_FFT, HOP_LENGTH, PCM_FORMATS,
+    fit_waveform, extract_log_mel, mel_bands, log_mel_from_bands,
+)
+
+WINDOW_SAMPLES = int(TARGET_SR * DURATION)
+# frames extract_log_mel produces for a full DURATION clip
+WINDOW_FRAMES = 1 + (WINDOW_SAMPLES - N_FFT) // HOP_LENGTH
+
+
+class _LinearResampler:
+    """Streaming counterpart of the linear interpolation in fit_waveform."""
+
+    def __init__(self, orig_sr, sr=TARGET_SR):
+        self.step = float(orig_sr) / float(sr)
+        self._pos = 0.0         # next output position, in input samples since the start
+        self._seen = 0          # input samples consumed so far
+        self._last = None       # final sample of the previous chunk
+
+    def push(self, x):
+        if self._last is not None:
+            x = np.concatenate(([self._last], x))
+            base = self._seen - 1
+        else:
+            base = self._seen
+        self._seen = base + len(x)
+        self._last = x[-1]
+        n_out = int(np.floor((self._seen - 1 - self._pos) / self.step)) + 1
+        if n_out <= 0:
+            return np.empty(0, np.float32)
+        positions = self._pos + self.step * np.arange(n_out)
+        self._pos = positions[-1] + self.step
+        return np.interp(positions - base, np.arange(len(x)), x).astype(np.float32)
+
+
+class StreamingFeatures:
+    def __init__(self, sample_rate=TARGET_SR, channels=1, sample_format="s16le"):
+        if sample_format not in PCM_FORMATS:
+            raise ValueError(f"Unsupported sample format '{sample_format}', expected one of {sorted(PCM_FORMATS)}")
+        self.channels = channels
+        self._dtype = PCM_FORMATS[sample_format]
+        self._frame_bytes = self._dtype.itemsize * channels
+        self._resampler = _LinearResampler(sample_rate) if sample_rate != TARGET_SR else None
+        self._carry = b""                           # partial PCM frame between chunks
+        self._tail = np.empty(0, np.float32)        # samples not yet covered by a full STFT frame
+        self._head = []                             # audio before the first window is full
+        self._bands = deque(maxlen=WINDOW_FRAMES)   # (N_MELS,) mel columns of the latest frames
+        self.samples = 0                            # samples at TARGET_SR received so far
+
+    @property
+    def seconds(self):
+        return self.samples / TARGET_SR
+
+    def push(self, pcm):
+        """Append a chunk of interleaved little-endian PCM; returns the new sample count."""
+        if self._carry:
+            pcm = self._carry + bytes(pcm)
+        usable = len(pcm) - len(pcm) % self._frame_bytes
+        self._carry = bytes(pcm[usable:])
+        if not usable:
+            return self.samples
+        x = np.frombuffer(pcm, dtype=self._dtype, count=usable // self._dtype.itemsize)
+        if self._dtype.kind == "i":
+            x = x.astype(np.float32) * np.float32(1.0 / 32768)
+        else:
+            x = x.astype(np.float32)
+        if self.channels > 1:
+            x = x.reshape(-1, self.channels).mean(axis=1)
+        if self._resampler is not None:
+            x = self._resampler.push(x)
+        if self._head is not None:
+            self._head.append(x)
+        self.samples += len(x)
+        if self._head is not None and self.samples >= WINDOW_SAMPLES:
+            self._head = None       # from here on the window comes from the mel frames
+        self._add_frames(x)
+        return self.samples
+
+    def _add_frames(self, x):
+        tail = np.concatenate((self._tail, x)) if len(self._tail) else x
+        if len(tail) < N_FFT:
+            self._tail = tail
+            return
+        frames = np.lib.stride_tricks.sliding_window_view(tail, N_FFT)[::HOP_LENGTH]
+        self._bands.extend(mel_bands(frames).T)
+        # keep what the next frame (which starts one hop after the last one) needs
+        self._tail = tail[len(frames) * HOP_LENGTH:].copy()
+
+    def snapshot(self):
+        """
+        Copy of what the latest window needs, cheap enough for the event loop:
+        the raw audio so far (1-D) before the first window is full, the mel
+        frames (2-D) after. None before any audio arrived.
+        """
+        if self.samples == 0:
+            return None
+        if self._head is not None:
+            return np.concatenate(self._head)
+        return np.stack(self._bands, axis=1)
+
+
+def window_features(snapshot):
+    """(1, 1, N_MELS, T) model input for a snapshot(); the heavier half, run on a worker."""
+    if snapshot.ndim == 1:
+        # not a full window yet: score it as a short clip, zero-padded like /classify does
+        feat = extract_log_mel(fit_waveform(snapshot, TARGET_SR))
+    else:
+        feat = log_mel_from_bands(snapshot)
+    return feat[np.newaxis, np.newaxis, :, :]
@@ -0,0 +1,85 @@
+# services/upload_limits.py
+"""
+Early rejection of oversized or non-audio uploads.
+
+UploadLimitMiddleware enforces MAX_UPLOAD_BYTES while the request body is
+still streaming in: a too-large Content-Length is refused before a single
+body byte is read, and chunked bodies are cut off as soon as they cross
+the limit, so the multipart parser never spools more than that.
+
+sniff_audio_format checks the container magic bytes at the start of an
+upload so bad files are rejected before anything is decoded.
+"""
+import os
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+MAX_UPLOAD_BYTES = int(os.environ.get("MAITRI_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# whole-request limit for multi-file uploads (each file is still held to MAX_UPLOAD_BYTES)
+MAX_BATCH_UPLOAD_BYTES = int(os.environ.get("MAITRI_MAX_BATCH_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+
+# bytes needed to recognise every supported container
+SNIFF_BYTES = 12
+
+
+class UploadTooLarge(HTTPException):
+    # an HTTPException so FastAPI's form parser re-raises it instead of turning it into a 400
+    def __init__(self, limit):
+        super().__init__(status_code=413, detail=f"Upload exceeds the {limit}-byte limit")
+
+
+def sniff_audio_format(head: bytes):
+    """Return a short container name for the first bytes of an upload, or None."""
+    if len(head) >= 12 and head[:4] in (b"RIFF", b"RIFX", b"RF64") and head[8:12] == b"WAVE":
+        return "wav"
+    if head[:4] == b"fLaC":
+        return "flac"
+    if head[:4] == b"OggS":
+        return "ogg"
+    if len(head) >= 12 and head[:4] == b"FORM" and head[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    return None
+
+
+class UploadLimitMiddleware:
+    """
+    Pure ASGI middleware (no body buffering) guarding POSTs under `path_prefix`.
+    `path_limits` maps exact paths to their own limit in place of `max_bytes`.
+    """
+
+    def __init__(self, app, path_prefix="/classify", max_bytes=MAX_UPLOAD_BYTES, path_limits=None):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > max_bytes:
+                    response = JSONResponse({"detail": UploadTooLarge(max_bytes).detail}, status_code=413)
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
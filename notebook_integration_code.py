@@ -9,6 +9,7 @@ This code provides:
 """
 
 # Cell 1: Import required libraries
+import hashlib
 import requests
 import json
 import numpy as np
@@ -33,23 +34,37 @@ def test_backend_health(backend_url: str = "http://127.0.0.1:8000") -> bool:
     return False
 
 
-def classify_audio_backend(audio_path: str, backend_url: str = "http://127.0.0.1:8000") -> Dict:
+def classify_audio_backend(audio_path: str, backend_url: str = "http://127.0.0.1:8000", priority: str = "interactive") -> Dict:
     """
     Get emotion classification from backend API.
     
     Args:
         audio_path: Path to audio file (WAV, MP3, etc)
         backend_url: Backend API base URL
+        priority: "interactive" or "batch"; bulk evaluation should use "batch"
+            so it never delays live crew recordings
         
     Returns:
         Dict with 'state' (emotion) and 'accuracy' (confidence)
     """
     try:
+        # Repeat runs over the same files: ask by content hash before uploading
+        with open(audio_path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        response = requests.post(
+            f"{backend_url}/classify/by-hash",
+            data={'sha256': digest},
+            timeout=30
+        )
+        if response.status_code == 200:
+            return response.json()
+
         with open(audio_path, 'rb') as f:
             files = {'audio': f}
             response = requests.post(
                 f"{backend_url}/classify",
                 files=files,
+                data={'priority': priority},
                 timeout=30
             )
         
@@ -66,6 +81,30 @@ def classify_audio_backend(audio_path: str, backend_url: str = "http://127.0.0.1
         return {"state": "Error", "accuracy": 0.0}
 
 
+def classify_audio_backend_batch(audio_paths: List[str], backend_url: str = "http://127.0.0.1:8000",
+                                 priority: str = "batch") -> List[Dict]:
+    """
+    Classify many files with one /classify/batch request.
+    Returns one dict per path, in order, with 'state' and 'accuracy'
+    (state "Error" for files the backend rejected).
+    """
+    files = [('audio', (Path(p).name, open(p, 'rb'), 'application/octet-stream')) for p in audio_paths]
+    try:
+        response = requests.post(f"{backend_url}/classify/batch", files=files, data={'priority': priority}, timeout=300)
+        response.raise_for_status()
+    finally:
+        for _, (_, fh, _) in files:
+            fh.close()
+    out = []
+    for item in response.json()['results']:
+        if 'error' in item:
+            print(f"Backend error for {item['filename']}: {item['error']}")
+            out.append({"state": "Error", "accuracy": 0.0})
+        else:
+            out.append({"state": item['emotion'], "accuracy": item['confidence']})
+    return out
+
+
 def classify_audio_notebook(audio_path: str) -> Dict:
     """
     Get emotion classification from notebook's predict_emotion function.
@@ -120,6 +159,14 @@ def compute_accuracy_comparison(
         print(f"Backend: {'Yes' if use_backend else 'No'}")
         print("-" * 80)
     
+    # one request for the whole set; fall back to per-file calls on older backends
+    backend_preds = None
+    if use_backend:
+        try:
+            backend_preds = classify_audio_backend_batch(audio_files, backend_url)
+        except Exception as e:
+            print(f"Batch request failed ({e}); classifying file by file")
+    
     for i, audio_path in enumerate(audio_files, 1):
         # Get notebook prediction
         notebook_pred = classify_audio_notebook(audio_path)
@@ -137,7 +184,10 @@ def compute_accuracy_comparison(
         
         # Get backend prediction if enabled
         if use_backend:
-            backend_pred = classify_audio_backend(audio_path, backend_url)
+            if backend_preds is not None:
+                backend_pred = backend_preds[i - 1]
+            else:
+                backend_pred = classify_audio_backend(audio_path, backend_url, priority="batch")
             backend_emotion = backend_pred.get('state', 'Unknown')
             backend_conf = backend_pred.get('accuracy', 0.0)
             
@@ -222,6 +272,53 @@ def save_results_to_file(metrics: Dict, output_file: str = "accuracy_results.jso
     print(f"Results saved to {output_file}")
 
 
+# Cell 5b: Optional - Pull logged history for analysis
+def load_history_export(backend_url: str = "http://127.0.0.1:8000", hours: int = 24, state: str = None) -> List[Dict]:
+    """
+    Stream a range of backend logs from /history/export (gzip NDJSON) and parse it line by line.
+    Unlike /history this has no page limit and the server never builds the whole document.
+    """
+    params = {'hours': hours, 'format': 'ndjson', 'gzip': 'true'}
+    if state:
+        params['state'] = state
+    rows = []
+    with requests.get(f"{backend_url}/history/export", params=params, stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line:
+                rows.append(json.loads(line))
+    return rows
+
+
+def load_history_columns(backend_url: str = "http://127.0.0.1:8000", hours: int = 24 * 7, state: str = None,
+                         messages: bool = False) -> Dict[str, np.ndarray]:
+    """
+    Fetch a range of backend logs as typed NumPy columns (/history/export?format=npz).
+    One np.load instead of a dict per row; `state` comes back as a string array.
+    User messages are only decoded into Python strings when `messages=True`.
+    """
+    import io
+    params = {'hours': hours, 'format': 'npz'}
+    if state:
+        params['state'] = state
+    response = requests.get(f"{backend_url}/history/export", params=params, timeout=300)
+    response.raise_for_status()
+    with np.load(io.BytesIO(response.content)) as npz:
+        data = {k: npz[k] for k in npz.files}
+    codes = data.pop('state_codes')
+    labels = np.append(data.pop('state_labels').astype(object), None)
+    data['state'] = labels[codes]   # code -1 picks the trailing None
+    if messages:
+        raw = data['user_message_data'].tobytes()
+        offsets = data['user_message_offsets']
+        data['user_message'] = np.array(
+            [raw[offsets[i]:offsets[i + 1]].decode('utf-8') if ok else None
+             for i, ok in enumerate(data['user_message_valid'])],
+            dtype=object,
+        )
+    return data
+
+
 # Cell 6: Optional - Visualization
 def plot_accuracy_results(metrics: Dict):
     """Plot accuracy results if matplotlib is available."""
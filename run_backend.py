@@ -1,30 +1,56 @@
-from backend.main import app
+from backend.main import app, DRAIN_TIMEOUT_S
 import uvicorn
+import os
 import sys
-import signal
+import threading
+
+# seconds uvicorn waits for in-flight requests after a stop signal
+GRACEFUL_TIMEOUT_S = int(os.environ.get("MAITRI_GRACEFUL_TIMEOUT_S", "30"))
+# hard limit on the whole shutdown: request wait + job/log drain + margin
+FORCE_EXIT_AFTER_S = GRACEFUL_TIMEOUT_S + 2 * DRAIN_TIMEOUT_S + 5
+
+
+class Server(uvicorn.Server):
+    """
+    uvicorn.Server with the old Ctrl+C messages. The first SIGINT/SIGTERM
+    sets should_exit: uvicorn stops accepting, waits for in-flight requests,
+    then the app's shutdown handler drains queued jobs and pending log rows.
+    A second signal, or FORCE_EXIT_AFTER_S without finishing, forces the exit.
+    """
+
+    def handle_exit(self, sig, frame):
+        if self.should_exit:
+            print(f"\n[INFO] Received signal {sig} again, forcing exit...", flush=True)
+            self.force_exit = True
+            return
+        print(f"\n[INFO] Received signal {sig}, draining in-flight work (up to {FORCE_EXIT_AFTER_S:.0f}s)...", flush=True)
+        super().handle_exit(sig, frame)
+        timer = threading.Timer(FORCE_EXIT_AFTER_S, self._force)
+        timer.daemon = True
+        timer.start()
+
+    def _force(self):
+        # force_exit doesn't interrupt a drain stuck in the app's shutdown handler
+        print(f"[WARN] Shutdown did not finish within {FORCE_EXIT_AFTER_S:.0f}s, forcing exit", flush=True)
+        os._exit(1)
 
-def signal_handler(sig, frame):
-    """Handle Ctrl+C gracefully"""
-    print(f"\n[INFO] Received signal {sig}, shutting down...", flush=True)
-    sys.exit(0)
 
 if __name__ == "__main__":
-    # Register signal handlers
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
     print("[INFO] Starting MAITRI backend on 0.0.0.0:8000...", flush=True)
     print("[INFO] Press Ctrl+C to stop", flush=True)
     sys.stdout.flush()
     
     try:
-        uvicorn.run(
+        server = Server(uvicorn.Config(
             app,
             host="0.0.0.0",
             port=8000,
             log_level="info",
-            access_log=True
-        )
+            access_log=True,
+            timeout_graceful_shutdown=GRACEFUL_TIMEOUT_S,
+        ))
+        server.run()
+        print("[INFO] Server stopped", flush=True)
     except KeyboardInterrupt:
         print("\n[INFO] Server stopped by user", flush=True)
     except Exception as e:
@@ -0,0 +1,352 @@
+"""
+Production launcher: preload the model once, then fork N uvicorn workers.
+
+The parent process imports the app, creates the database schema, loads and
+warms the model (signatures, mel filterbank, one full scoring pass) and
+freezes the GC, so everything allocated so far is moved out of the
+collector's reach. Workers forked afterwards share those pages copy-on-write
+instead of each loading its own copy; the memory report printed after
+startup (and on SIGUSR1) shows what each extra worker actually costs.
+
+All workers accept on one listening socket opened by the parent, so the
+kernel keeps queueing connections while a worker restarts.
+
+With more than one worker:
+  - the in-memory recent-history buffer is disabled (MAITRI_RECENT_BUFFER_SIZE=0);
+    it is only exact while its process is the sole writer of the database
+  - only worker 0 runs background jobs (log retention)
+  - /metrics, /scheduler/stats and the result cache are per worker
+
+Usage:
+    python run_production.py [--workers N] [--host HOST] [--port PORT]
+
+Signals (to the parent):
+    SIGTERM / SIGINT  graceful shutdown of every worker
+    SIGHUP            rolling restart, one worker at a time
+    SIGUSR1           print the memory report
+
+A rolling restart forks fresh workers from the already-loaded parent: it
+resets worker state and memory, but code changes need a full restart.
+"""
+import os
+import gc
+import sys
+import math
+import time
+import select
+import signal
+import socket
+import asyncio
+import argparse
+
+# seconds a worker gets to finish in-flight requests on SIGTERM
+GRACEFUL_TIMEOUT_S = int(os.environ.get("MAITRI_GRACEFUL_TIMEOUT_S", "30"))
+# backend.main's drain of queued jobs and log rows, after the requests (same variable)
+DRAIN_TIMEOUT_S = float(os.environ.get("MAITRI_DRAIN_TIMEOUT_S", "20"))
+# pause between a worker's last accept() and closing its idle connections
+ACCEPT_SETTLE_S = 0.25
+# seconds a new worker gets to finish its startup before it counts as failed
+READY_TIMEOUT_S = 60
+# pause before replacing a worker that died on its own
+RESPAWN_DELAY_S = 1.0
+
+
+def available_cores():
+    """CPUs this process may run on, capped by a cgroup v2 CPU quota if one is set."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as fh:
+            quota, period = fh.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def memory_stats(pid):
+    """Rss, Pss and private bytes of a process (from /proc/<pid>/smaps_rollup), or None."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as fh:
+            for line in fh:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    except OSError:
+        return None
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def _mib(n):
+    return f"{n / (1024 * 1024):.1f} MiB"
+
+
+def preload():
+    """Import the app, create the schema and warm the model; returns the ASGI app."""
+    from backend.main import app, retention
+    from backend.database.db import init_db, close_db
+    from backend.services.audio_service import extract_log_mel, TARGET_SR, DURATION
+    from backend.models.model_function import run_emotion_model, compact_features, model_version
+
+    async def prepare_database():
+        # run the schema setup / first-time backfills once here instead of racing in every worker
+        try:
+            await init_db(incremental_vacuum=retention.enabled)
+        except Exception as e:
+            print(f"[WARN] DB initialization failed in the launcher: {e}", flush=True)
+        finally:
+            await close_db()
+
+    asyncio.run(prepare_database())
+
+    import numpy as np
+    noise = np.random.default_rng(0).standard_normal(int(TARGET_SR * DURATION)).astype(np.float32) * 0.1
+    features = extract_log_mel(noise)[np.newaxis, np.newaxis, :, :]
+    run_emotion_model(features)
+    compact_features(features)
+    print(f"[INFO] Model {model_version()} loaded and warmed in the launcher", flush=True)
+    return app
+
+
+class Launcher:
+    def __init__(self, app, sock, workers, host, port):
+        self.app = app
+        self.sock = sock
+        self.count = workers
+        self.host = host
+        self.port = port
+        self.workers = {}       # slot -> pid
+        self._stopping = False
+        self._restart_requested = False
+        self._report_requested = False
+
+    # ---- worker side ----
+
+    def _run_worker(self, slot, ready_fd):
+        import uvicorn
+
+        os.environ["MAITRI_WORKER_ID"] = str(slot)
+        os.environ["MAITRI_BACKGROUND_JOBS"] = "1" if slot == 0 else "0"
+        # uvicorn installs its own SIGINT/SIGTERM handlers; the launcher's others don't apply here
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+        class NotifyingServer(uvicorn.Server):
+            async def startup(self, sockets=None):
+                await super().startup(sockets=sockets)
+                if not self.should_exit:
+                    os.write(ready_fd, b"1")
+                os.close(ready_fd)
+
+            async def shutdown(self, sockets=None):
+                # stop accepting, then give connections accepted just before a
+                # moment to send their request: uvicorn closes idle connections
+                # outright, which would reset a request already on the wire
+                for server in self.servers:
+                    server.close()
+                await asyncio.sleep(ACCEPT_SETTLE_S)
+                await super().shutdown(sockets=sockets)
+
+        config = uvicorn.Config(
+            self.app,
+            host=self.host,
+            port=self.port,
+            log_level="info",
+            access_log=True,
+            timeout_graceful_shutdown=GRACEFUL_TIMEOUT_S,
+        )
+        NotifyingServer(config).run(sockets=[self.sock])
+
+    # ---- parent side ----
+
+    def spawn(self, slot):
+        """Fork a worker for `slot` and wait until it accepts requests; returns its pid or None."""
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                self._run_worker(slot, write_fd)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+        os.close(write_fd)
+        try:
+            readable, _, _ = select.select([read_fd], [], [], READY_TIMEOUT_S)
+            ready = bool(readable) and os.read(read_fd, 1) == b"1"
+        finally:
+            os.close(read_fd)
+        if not ready:
+            print(f"[ERROR] Worker {slot} (pid {pid}) failed to start", flush=True)
+            self._terminate(pid)
+            return None
+        self.workers[slot] = pid
+        print(f"[INFO] Worker {slot} ready (pid {pid})", flush=True)
+        return pid
+
+    def _terminate(self, pid, timeout=GRACEFUL_TIMEOUT_S + 2 * DRAIN_TIMEOUT_S + 10):
+        """SIGTERM, wait up to `timeout`, then SIGKILL. Reaps the process."""
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if done:
+                return
+            time.sleep(0.1)
+        print(f"[WARN] Worker pid {pid} did not stop within {timeout}s, killing it", flush=True)
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+    def rolling_restart(self):
+        # stop first, then start: the listening socket stays open in this process,
+        # so new connections wait in the backlog instead of being refused
+        print("[INFO] Rolling restart", flush=True)
+        for slot in sorted(self.workers):
+            if self._stopping:
+                return
+            self._terminate(self.workers.pop(slot))
+            self.spawn(slot)
+        self.memory_report()
+
+    def reap(self):
+        """Forget workers that exited on their own; fill_slots() replaces them."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            for slot, worker_pid in list(self.workers.items()):
+                if worker_pid == pid:
+                    del self.workers[slot]
+                    print(f"[WARN] Worker {slot} (pid {pid}) exited with status {status}, replacing it", flush=True)
+
+    def fill_slots(self):
+        missing = [slot for slot in range(self.count) if slot not in self.workers]
+        for slot in missing:
+            if self._stopping:
+                return
+            time.sleep(RESPAWN_DELAY_S)
+            self.spawn(slot)
+
+    def memory_report(self):
+        """Print per-process memory and whether total memory grows sub-linearly with workers."""
+        parent = memory_stats(os.getpid())
+        children = [memory_stats(pid) for pid in self.workers.values()]
+        children = [c for c in children if c is not None]
+        if parent is None or not children:
+            print("[INFO] Memory report unavailable (no /proc/<pid>/smaps_rollup)", flush=True)
+            return
+        mean_rss = sum(c["rss"] for c in children) / len(children)
+        mean_private = sum(c["private"] for c in children) / len(children)
+        total_pss = parent["pss"] + sum(c["pss"] for c in children)
+        # what the same workers would take as independent processes, sharing nothing
+        unshared = mean_rss * len(children)
+        ratio = total_pss / unshared if unshared else 0.0
+        print(
+            f"[INFO] Memory: {len(children)} workers, launcher RSS {_mib(parent['rss'])}, "
+            f"worker RSS {_mib(mean_rss)} of which private {_mib(mean_private)}; "
+            f"total PSS {_mib(total_pss)} vs {_mib(unshared)} unshared ({ratio:.2f}x)",
+            flush=True,
+        )
+        if len(children) > 1 and mean_private > 0.5 * mean_rss:
+            print("[WARN] Workers share less than half of their memory; check for writes to preloaded objects", flush=True)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_restart)
+        signal.signal(signal.SIGUSR1, self._on_report)
+
+        for slot in range(self.count):
+            self.spawn(slot)
+        print(f"[INFO] MAITRI backend on {self.host}:{self.port} with {len(self.workers)} workers", flush=True)
+        self.memory_report()
+
+        while not self._stopping:
+            if self._restart_requested:
+                self._restart_requested = False
+                self.rolling_restart()
+            if self._report_requested:
+                self._report_requested = False
+                self.memory_report()
+            self.reap()
+            self.fill_slots()
+            time.sleep(0.5)
+
+        print("[INFO] Stopping workers...", flush=True)
+        for pid in self.workers.values():
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self.workers.values():
+            self._terminate(pid)
+        self.workers.clear()
+        self.sock.close()
+        print("[INFO] Server stopped", flush=True)
+
+    def _on_stop(self, sig, frame):
+        self._stopping = True
+
+    def _on_restart(self, sig, frame):
+        self._restart_requested = True
+
+    def _on_report(self, sig, frame):
+        self._report_requested = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the MAITRI backend with preloaded, forked workers")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("MAITRI_WORKERS", "0")),
+                        help="worker processes (default: available cores)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    workers = args.workers if args.workers > 0 else available_cores()
+
+    if workers > 1:
+        if os.environ.get("MAITRI_RECENT_BUFFER_SIZE", "0") != "0":
+            print("[WARN] MAITRI_RECENT_BUFFER_SIZE ignored: the recent buffer needs a single worker", flush=True)
+        # must be set before backend.main is imported
+        os.environ["MAITRI_RECENT_BUFFER_SIZE"] = "0"
+
+    # bind before loading anything, so a busy port fails fast
+    sock = socket.create_server((args.host, args.port), backlog=2048)
+    sock.set_inheritable(True)
+
+    app = preload()
+    # keep everything allocated so far out of GC passes, which would touch
+    # (and so copy) the shared pages in every worker
+    gc.collect()
+    gc.freeze()
+
+    Launcher(app, sock, workers, args.host, args.port).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Coalesced identical requests must not inherit the first caller's priority
+or deadline (/classify and friends share one computation per content hash).
+
+    python -m pytest tests/test_coalescing_priority.py
+"""
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from backend import main
+from backend.services.result_cache import ResultCache
+from backend.services.scheduler import PriorityScheduler
+from backend.services.singleflight import SingleFlight
+
+
+@pytest.fixture
+def one_worker(monkeypatch):
+    """A fresh single-worker scheduler, cache and coalescer in place of the app's."""
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(main, "scheduler", PriorityScheduler(executor, 1))
+    monkeypatch.setattr(main, "inflight", SingleFlight())
+    monkeypatch.setattr(main, "result_cache", ResultCache())
+    yield main.scheduler
+    executor.shutdown(wait=True)
+
+
+def _score(order, name):
+    def fn(content_hash):
+        order.append(name)
+        return {"state": "Neutral", "accuracy": 0.9, "inference_time": 0.0, "who": name}
+    return fn
+
+
+async def _occupy(scheduler):
+    """Keep the only worker busy until the returned event is set."""
+    release = threading.Event()
+    busy = asyncio.ensure_future(scheduler.submit(release.wait, priority="interactive"))
+    await asyncio.sleep(0)
+    return release, busy
+
+
+def test_follower_without_deadline_survives_leaders_deadline(one_worker):
+    async def scenario():
+        release, busy = await _occupy(one_worker)
+        order = []
+        leader = asyncio.ensure_future(main._cached_classification(
+            "same", "batch", time.monotonic() + 0.05, _score(order, "shared")))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(main._cached_classification(
+            "same", "interactive", None, _score(order, "follower")))
+        await asyncio.sleep(0.1)        # the leader's deadline passes while the worker is busy
+        release.set()
+        await busy
+        return await asyncio.gather(leader, follower, return_exceptions=True)
+
+    leader, follower = asyncio.run(scenario())
+    # the shared job now runs on the follower's (absent) deadline, so both get the result
+    assert not isinstance(follower, BaseException), follower
+    assert follower["state"] == leader["state"] == "Neutral"
+
+
+def test_follower_raises_the_shared_jobs_priority(one_worker):
+    async def scenario():
+        release, busy = await _occupy(one_worker)
+        order = []
+        other = asyncio.ensure_future(one_worker.submit(_score(order, "other batch"), None, priority="batch"))
+        await asyncio.sleep(0)
+        leader = asyncio.ensure_future(main._cached_classification("same", "batch", None, _score(order, "shared")))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(main._cached_classification(
+            "same", "interactive", None, _score(order, "follower")))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(busy, other, leader, follower)
+        return order
+
+    # the interactive follower pulls the shared job ahead of the batch job queued before it
+    assert asyncio.run(scenario()) == ["shared", "other batch"]
+
+
+def test_leader_alone_still_gets_504(one_worker):
+    async def scenario():
+        release, busy = await _occupy(one_worker)
+        leader = asyncio.ensure_future(main._cached_classification(
+            "same", "batch", time.monotonic() + 0.05, _score([], "shared")))
+        await asyncio.sleep(0.1)
+        release.set()
+        await busy
+        return await asyncio.gather(leader, return_exceptions=True)
+
+    (leader,) = asyncio.run(scenario())
+    assert isinstance(leader, HTTPException) and leader.status_code == 504
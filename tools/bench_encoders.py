@@ -0,0 +1,84 @@
+"""
+Encoder cost for a /history-sized response body.
+
+Compares the default FastAPI path (dict per row -> jsonable_encoder ->
+json.dumps) with the row encoders in services/response_encoding, on
+synthetic log rows shaped like the logs table.
+
+    python tools/bench_encoders.py --rows 10000
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+
+# run against the backend sources, imported as the `backend` package like the app itself
+repo_root = Path(__file__).resolve().parents[1]
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+
+from fastapi.encoders import jsonable_encoder
+
+from backend.database.db import LOG_COLUMNS
+from backend.services import response_encoding
+from backend.services.response_encoding import Rows, encode_json, encode_msgpack
+
+
+def make_rows(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    states = ['Neutral', 'Happy', 'Sad', 'Anger', 'Disgust']
+    return [
+        (i, rng.choice(states), round(rng.uniform(0.5, 0.99), 4), f"crew note {i}: all nominal",
+         round(rng.uniform(0.002, 0.02), 4), 1_700_000_000 + i)
+        for i in range(n, 0, -1)
+    ]
+
+
+def fastapi_default(rows):
+    results = [dict(zip(LOG_COLUMNS, row)) for row in rows]
+    return json.dumps(jsonable_encoder({"history": results, "next_cursor": None})).encode()
+
+
+def time_it(fn, repeat: int):
+    fn()
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    payload = {"history": Rows(LOG_COLUMNS, rows), "next_cursor": None}
+    json_name = 'orjson rows' if response_encoding.orjson is not None else 'stdlib json rows'
+    cases = [
+        ('fastapi default (jsonable_encoder)', lambda: fastapi_default(rows)),
+        (json_name, lambda: encode_json(payload)),
+    ]
+    if response_encoding.msgpack is not None:
+        cases.append(('msgpack rows', lambda: encode_msgpack(payload)))
+    else:
+        print("msgpack not installed; skipping the MessagePack encoder")
+
+    # the fast path must produce the same document the default path does
+    assert json.loads(encode_json(payload)) == json.loads(fastapi_default(rows))
+
+    print(f"{args.rows} rows, best of {args.repeat}")
+    baseline = None
+    for name, fn in cases:
+        seconds, size = time_it(fn, args.repeat)
+        baseline = baseline or seconds
+        print(f"  {name:<36} {seconds * 1000:8.2f} ms  {size / 1024:8.1f} KiB  {baseline / seconds:6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
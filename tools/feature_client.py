@@ -0,0 +1,73 @@
+"""
+Edge-station client for /classify/features.
+
+Computes log-mel features locally with the backend's own audio_service code
+and uploads only the compact (float16) feature matrix instead of the audio:
+about 32 KB for a 4 s clip, versus ~128 KB of 16-bit WAV.
+
+    python tools/feature_client.py recording.wav --url http://station-gw:8000
+"""
+import sys
+from pathlib import Path
+import requests
+
+# Same import arrangement as notebook_helper: run against the backend sources
+repo_root = Path(__file__).resolve().parents[1]
+if str(repo_root / 'backend') not in sys.path:
+    sys.path.insert(0, str(repo_root / 'backend'))
+
+from services.audio_service import make_model_input
+from services.feature_codec import encode_features, feature_config, FEATURE_CONTENT_TYPE
+
+
+def compute_features(wav_path: str, dtype: str = 'float16', compress: bool = False) -> bytes:
+    """Read an audio file and return the encoded features, ready to POST."""
+    p = Path(wav_path)
+    if not p.exists():
+        raise FileNotFoundError(f"File not found: {wav_path}")
+    with p.open('rb') as fh:
+        features = make_model_input(fh)
+    return encode_features(features, dtype=dtype, compress=compress)
+
+
+def check_server_config(base_url: str = 'http://127.0.0.1:8000') -> bool:
+    """True if the server expects exactly the features this client computes."""
+    resp = requests.get(f"{base_url.rstrip('/')}/classify/features/config", timeout=10)
+    resp.raise_for_status()
+    server = resp.json()
+    local = feature_config()
+    mismatched = {k: (local[k], server.get(k)) for k in local if k != 'dtypes' and local[k] != server.get(k)}
+    if mismatched:
+        print(f"Feature config mismatch (local, server): {mismatched}")
+    return not mismatched
+
+
+def classify_features(wav_path: str, base_url: str = 'http://127.0.0.1:8000', message: str = '',
+                      dtype: str = 'float16', compress: bool = False):
+    """Compute features for `wav_path` locally and classify them on the server."""
+    body = compute_features(wav_path, dtype=dtype, compress=compress)
+    resp = requests.post(
+        f"{base_url.rstrip('/')}/classify/features",
+        params={'message': message},
+        data=body,
+        headers={'Content-Type': FEATURE_CONTENT_TYPE},
+        timeout=30,
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('wav', help='Path to audio file')
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--message', default='')
+    parser.add_argument('--float32', action='store_true', help='send float32 instead of float16')
+    parser.add_argument('--compress', action='store_true', help='zlib-compress the payload')
+    args = parser.parse_args()
+
+    if not check_server_config(args.url):
+        sys.exit(1)
+    print(classify_features(args.wav, args.url, args.message,
+                            dtype='float32' if args.float32 else 'float16', compress=args.compress))
@@ -1,4 +1,5 @@
 import sys
+import hashlib
 from pathlib import Path
 import requests
 
@@ -40,12 +41,22 @@ def run_local_model_from_file(wav_path: str):
 
 def classify_via_backend_file(wav_path: str, url: str = "http://127.0.0.1:8000/classify"):
     """POST a WAV file to the backend `/classify` endpoint and return the response object.
+    The file's SHA-256 is offered to `/classify/by-hash` first, so audio the server
+    has already scored is never uploaded again.
     Raises requests exceptions on network errors.
     """
     p = Path(wav_path)
     if not p.exists():
         raise FileNotFoundError(f"File not found: {wav_path}")
 
+    digest = hashlib.sha256(p.read_bytes()).hexdigest()
+    data = {'sha256': digest, 'message': 'notebook helper request'}
+    resp = requests.post(f"{url.rstrip('/')}/by-hash", data=data, timeout=30)
+    if resp.status_code == 200:
+        return resp.json()
+    if resp.status_code != 404:
+        resp.raise_for_status()
+
     with p.open('rb') as fh:
         files = {'audio': (p.name, fh, 'audio/wav')}
         data = {'message': 'notebook helper request'}